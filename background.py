@@ -0,0 +1,176 @@
+# Standard imports
+from queue import Empty, SimpleQueue
+from threading import Lock, Thread
+from time import perf_counter, sleep
+
+# How often the worker looks at the clock, simulates the time that has
+# passed and publishes a snapshot. Sleeping the rest of the period gives
+# the Tk thread the GIL for input and drawing.
+WORKER_PERIOD = 0.01  # Seconds
+
+# Never simulate more than this much real time in one go. If the steps
+# are slower than real time, the simulation falls behind instead of
+# trying to catch up with ever larger chunks.
+MAX_CATCH_UP = 0.1  # Seconds
+
+
+class BodySnapshot:
+    """Read-only copy of what draw.py needs from a Body"""
+    __slots__ = ("key", "name", "pos", "radius", "force", "trail_positions")
+
+    def __init__(self, body) -> None:
+        # See trail_key() in draw.py, a ReplayBody already has a key
+        self.key = getattr(body, "key", id(body))
+        self.name = body.name
+        self.pos = body.pos
+        self.radius = body.radius
+        self.force = body.force
+        self.trail_positions = tuple(body.trail_positions)
+
+class Snapshot:
+    """Everything redraw_all() needs from the simulation at one point in time"""
+    __slots__ = ("bodies", "particle_pos", "sim_sec_passed", "simrate")
+
+    def __init__(self, bodies, particles, sim_sec_passed: float, simrate: float) -> None:
+        self.bodies = tuple(BodySnapshot(body) for body in bodies)
+        self.particle_pos = None if particles is None else particles.pos.copy()
+        self.sim_sec_passed = sim_sec_passed
+        self.simrate = simrate
+
+class SnapshotBuffer:
+    """Double buffer of snapshots: one being written, one ready to be drawn
+
+    The worker writes into the back slot and then flips it to the front,
+    so latest() always returns a completed snapshot. Snapshots are never
+    changed after they are published, so the reader can keep using one
+    for as long as it likes.
+    """
+    __slots__ = ("slots", "front", "lock")
+
+    def __init__(self, snapshot: Snapshot) -> None:
+        self.slots = [snapshot, snapshot]
+        self.front = 0
+        self.lock = Lock()
+
+    def publish(self, snapshot: Snapshot) -> None:
+        back = 1 - self.front
+        self.slots[back] = snapshot
+        with self.lock:
+            self.front = back
+
+    def latest(self) -> Snapshot:
+        with self.lock:
+            return self.slots[self.front]
+
+class SimulationWorker:
+    """Runs the simulation of app in a background thread
+
+    While the worker runs it owns the bodies and the particles (they are
+    taken off the app), and the Tk thread only reads the latest snapshot.
+    Changes to the bodies from the Tk thread, like placing a Sun, are
+    sent with submit() and run by the worker between two steps.
+
+    The settings are read from the app on every step, so pausing,
+    changing the simrate and the force mode work as before.
+    """
+    __slots__ = ("app", "simulate", "bodies", "particles", "buffer", "commands",
+                 "thread", "running", "error", "sim_sec_passed", "simrate")
+
+    def __init__(self, app, simulate) -> None:
+        """simulate is simulate_bodies(), passed in to keep the imports one-way"""
+        self.app = app
+        self.simulate = simulate
+        self.bodies = app.bodies
+        self.particles = app.particles
+        self.sim_sec_passed = app.sim_sec_passed
+        self.simrate = 0
+        self.buffer = SnapshotBuffer(self.take_snapshot())
+        self.commands = SimpleQueue()
+        self.thread = None
+        self.running = False
+        self.error = None
+
+    def take_snapshot(self) -> Snapshot:
+        return Snapshot(self.bodies, self.particles, self.sim_sec_passed, self.simrate)
+
+    def submit(self, command) -> None:
+        """Calls command(bodies) in the worker thread before the next step"""
+        self.commands.put(command)
+
+    def start(self) -> None:
+        self.running = True
+        # Daemon, so closing the window never waits for a long step
+        self.thread = Thread(target=self._run, name="simulation", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def _run(self) -> None:
+        try:
+            self._loop()
+        except Exception as error:
+            # Raised again in the Tk thread by show_latest_snapshot()
+            self.error = error
+
+    def _loop(self) -> None:
+        app = self.app
+        prev_time = perf_counter()
+        while self.running:
+            while True:
+                try:
+                    command = self.commands.get_nowait()
+                except Empty:
+                    break
+                command(self.bodies)
+
+            now = perf_counter()
+            real_passed = now - prev_time
+            prev_time = now
+
+            if not app.sim_paused:
+                sim_time = app.sec_to_sim_per_sec * min(real_passed, MAX_CATCH_UP)
+                self.simulate(self.bodies, sim_time, app.MAX_TIME_TO_SIM,
+                              app.force_mode, app.theta, app.integrator, app.tolerance,
+                              self.particles, app.force_pool, app.recorder, app.integrator_cache)
+                self.sim_sec_passed += sim_time
+                self.simrate = sim_time / real_passed
+
+            self.buffer.publish(self.take_snapshot())
+            sleep(max(0, WORKER_PERIOD - (perf_counter() - now)))
+
+def start_worker(app, simulate) -> None:
+    """Hands the bodies of app over to a new SimulationWorker and starts it"""
+    app.worker = SimulationWorker(app, simulate)
+    app.snapshot = app.worker.buffer.latest()
+    app.bodies = None
+    app.particles = None
+    app.prev_frame_at = perf_counter()
+    app.worker.start()
+
+def stop_worker(app) -> None:
+    """Stops the worker and gives the bodies back to app"""
+    worker = app.worker
+    worker.stop()
+    app.bodies = worker.bodies
+    app.particles = worker.particles
+    app.sim_sec_passed = worker.sim_sec_passed
+    app.worker = None
+    app.snapshot = None
+
+def show_latest_snapshot(app) -> None:
+    """Picks up the latest snapshot from the worker, to be drawn by redraw_all()"""
+    if app.worker.error is not None:
+        raise app.worker.error
+
+    now = perf_counter()
+    app.frametime = now - app.prev_frame_at
+    app.frames_per_sec = 1/app.frametime if app.frametime > 0 else 0
+    app.prev_frame_at = now
+
+    app.snapshot = app.worker.buffer.latest()
+    app.sim_sec_passed = app.snapshot.sim_sec_passed
+    app.actual_simrate = app.snapshot.simrate
@@ -1,4 +1,5 @@
 # Standard imports
+from collections import deque
 from random import randrange
 from math import atan2, cos, sin, sqrt
 
@@ -9,6 +10,18 @@ from general import ranges_overlap
 PI = 3.141592653589793  # Pi with 15 decimals (JPL's accuracy)
 G = 6.674 * 10**(-11)   # The gravitational constant (Nm²/kg²)
 
+# Most saved positions a trail keeps, on top of the current position.
+# Trails are normally cut by max_trail_length long before this.
+TRAIL_CAPACITY = 64
+
+# A trail saves a new position when the line from the last saved one
+# would be further than trail_accuracy from the path (see update_trail()).
+# These keep the estimate of that distance valid, and the tail of the
+# trail from jumping by more than a small part of it when it is cut.
+TRAIL_ACCURACY = 5 * 10**7  # Default trail_accuracy (m), under a pixel at the start zoom
+TRAIL_MAX_TURN = 0.5      # Radians the heading may turn between two saved positions
+TRAIL_MIN_SEGMENTS = 8    # Lines a full trail is made of, at least
+
 
 def init_bodies(app) -> None:
     # - All start on the same line (pos_x = 0)
@@ -72,10 +85,82 @@ def init_bodies(app) -> None:
     app.bodies = [app.sun, mercury, venus, earth, mars, jupiter, saturn, uranus, neptune]
     app.num_of_new_suns = 0
 
+class StoreField:
+    """A Body attribute that can live in a BodyStore
+
+    Until the body is adopted by a BodyStore (see body_store.py) the
+    value is kept on the body itself. After that the body is only a view,
+    and the value is read from and written to the store's arrays.
+
+    Vector fields (pos, speed, force) are kept on the body as two floats,
+    _pos_x and _pos_y etc., and only put together into a tuple when read.
+    """
+    def __init__(self, vector: bool = False) -> None:
+        self.vector = vector
+
+    def __set_name__(self, owner, name: str) -> None:
+        self.name = name
+        self.local_name = "_" + name
+        self.local_x = "_" + name + "_x"
+        self.local_y = "_" + name + "_y"
+
+    def __get__(self, body, owner=None):
+        if body is None:
+            return self
+        if body._store is None:
+            return self.get_local(body)
+        return body._store.get_field(self.name, body._index)
+
+    def __set__(self, body, value) -> None:
+        if body._store is None:
+            self.set_local(body, value)
+        else:
+            body._store.set_field(self.name, body._index, value)
+
+    def get_local(self, body):
+        """Returns the value kept on the body itself"""
+        if self.vector:
+            return (getattr(body, self.local_x), getattr(body, self.local_y))
+        return getattr(body, self.local_name)
+
+    def set_local(self, body, value) -> None:
+        """Sets the value kept on the body itself"""
+        if self.vector:
+            value_x, value_y = value
+            setattr(body, self.local_x, float(value_x))
+            setattr(body, self.local_y, float(value_y))
+        else:
+            setattr(body, self.local_name, value)
+
 class Body:
     """Class for celestial bodies"""
-    def __init__(self, pos_x: int, pos_y: int, speed_x: int, speed_y: int, 
+    # No __dict__: a body is a fixed set of slots, and the vectors are
+    # stored as plain floats that drift() and kick() update in place
+    __slots__ = ("_store", "_index", "name", "density",
+                 "_pos_x", "_pos_y", "_speed_x", "_speed_y", "_force_x", "_force_y",
+                 "_mass", "_radius", "_static",
+                 "_trail_positions", "_trail_length", "_max_trail_length", "_trail_accuracy",
+                 "_trail_heading_x", "_trail_heading_y")
+
+    # Values which are moved into the arrays of a BodyStore
+    pos = StoreField(vector=True)
+    speed = StoreField(vector=True)
+    force = StoreField(vector=True)
+    mass = StoreField()
+    radius = StoreField()
+    static = StoreField()
+    trail_positions = StoreField()
+    trail_length = StoreField()
+    max_trail_length = StoreField()
+    trail_accuracy = StoreField()
+    trail_heading = StoreField(vector=True)
+
+    def __init__(self, pos_x: int | float, pos_y: int | float, speed_x: int | float, speed_y: int | float, 
                        mass:  int, density: int, name="", static=False) -> None:
+        # Not in a BodyStore (yet)
+        self._store = None
+        self._index = -1
+
         # Init Defined values
         self.name = name
         self.pos = (pos_x, pos_y)
@@ -87,12 +172,28 @@ class Body:
         # Default start values
         self.radius = round(((self.mass/self.density)*(3/(4*PI)))**(1/3))
         self.force = (0, 0)
-        self.trail_positions = [self.pos, self.pos]
+        start_pos = self.pos
+        self.trail_positions = deque([start_pos, start_pos])
         self.trail_length = 0
         self.max_trail_length = 11**11
-        self.trail_accuracy = 5 * 10**9  # This gives good curve on trail and good perf.
+        self.trail_accuracy = TRAIL_ACCURACY  # Largest distance (m) between the trail and the path
+        self.trail_heading = self.speed  # Speed when the last position was saved
+
+    @classmethod
+    def view_of(cls, store, index: int, name: str, density: int | float) -> "Body":
+        """Returns a Body that is a view over row index of store, which already has its values
 
-    def distance_to(self, other_body) -> int:
+        Skips __init__(), which would compute the values and then copy
+        them into the store one by one. The caller sets the trail.
+        """
+        body = cls.__new__(cls)
+        body._store = store
+        body._index = index
+        body.name = name
+        body.density = density
+        return body
+
+    def distance_to(self, other_body) -> float:
         """Returns the shortest distance between this body and other_body"""
         this_x, this_y = self.pos
         other_x, other_y = other_body.pos
@@ -100,7 +201,7 @@ class Body:
         delta_x = (this_x - other_x)
         delta_y = (this_y - other_y)
 
-        distance = round(sqrt(delta_x**2 + delta_y**2))
+        distance = sqrt(delta_x*delta_x + delta_y*delta_y)
         return  distance
 
     def angle_towards(self, other_body) -> float:
@@ -129,10 +230,10 @@ class Body:
         else:
             return False
 
-    def force_from(self, other) -> tuple[int, int]:
+    def force_from(self, other) -> tuple[float, float]:
         """Returns the force the other body(ies) is subjecting on to this body"""
-        force_x = 0
-        force_y = 0
+        force_x = 0.0
+        force_y = 0.0
         
         if isinstance(other, Body):
             distance = self.distance_to(other)
@@ -142,16 +243,19 @@ class Body:
                 return (force_x, force_y)
             else:
                 force = (G * self.mass * other.mass) / distance**2
-                force_x = round((force * cos(angle)))
-                force_y = round((force * sin(angle)))
+                force_x = force * cos(angle)
+                force_y = force * sin(angle)
                 return (force_x, force_y)
         elif isinstance(other, list):
             for other_body in other:
-                force_x = round(force_x + self.force_from(other_body)[0])
-                force_y = round(force_y + self.force_from(other_body)[1])
+                other_force_x, other_force_y = self.force_from(other_body)
+                force_x += other_force_x
+                force_y += other_force_y
             return (force_x, force_y)
+        else:
+            raise TypeError(f"Can't compute the force from a {type(other).__name__}")
 
-    def speed_after(self, time: int | float) -> tuple[int, int]:
+    def speed_after(self, time: int | float) -> tuple[float, float]:
         """
         Returns new speed in x and y direction based on all the forces
         acting on the object, and the time that they have acted
@@ -161,71 +265,137 @@ class Body:
         
         accel_x = force_x / self.mass
         accel_y = force_y / self.mass
-        new_speed_x = round(speed_x + accel_x*time)  # v = v_0 + a*t
-        new_speed_y = round(speed_y + accel_y*time)  # v = v_0 + a*t
+        new_speed_x = speed_x + accel_x*time  # v = v_0 + a*t
+        new_speed_y = speed_y + accel_y*time  # v = v_0 + a*t
 
         return (new_speed_x, new_speed_y)
 
-    def pos_after(self, time: int | float) -> tuple[int, int]:
+    def pos_after(self, time: int | float) -> tuple[float, float]:
         """Returns the new x and y positions after a given time"""
         speed_x, speed_y = self.speed
         pos_x, pos_y = self.pos
         
-        new_pos_x = round(pos_x + (speed_x * time))  # s = v*t
-        new_pos_y = round(pos_y + (speed_y * time))  # s = v*t
+        new_pos_x = pos_x + (speed_x * time)  # s = v*t
+        new_pos_y = pos_y + (speed_y * time)  # s = v*t
 
         return (new_pos_x, new_pos_y)
 
-    def update_trail(self) -> None:
-        # This method needs refactoring lol
-        # - self.trail_positions[-1] is always current position
-        # - self.trail_positions[-2] is last saved position 
-        #   self.trail_accuracy away from current position
+    def drift(self, time: int | float) -> None:
+        """Moves the body along its speed for the given time, in place
 
-        pos_x, pos_y = self.pos
-        prev_x, prev_y = self.trail_positions[-2]
+        Same as body.pos = body.pos_after(time), without the tuples.
+        """
+        if self._store is not None:
+            self.pos = self.pos_after(time)
+            return
+        self._pos_x += self._speed_x * time  # s = v*t
+        self._pos_y += self._speed_y * time
+
+    def kick(self, time: int | float) -> None:
+        """Changes the speed by the force acting for the given time, in place
+
+        Same as body.speed = body.speed_after(time), without the tuples.
+        """
+        if self._store is not None:
+            self.speed = self.speed_after(time)
+            return
+        self._speed_x += self._force_x / self._mass * time  # v = v_0 + a*t
+        self._speed_y += self._force_y / self._mass * time
+
+    def update_trail(self) -> None:
+        """Moves the end of the trail to the current position
+
+        - self.trail_positions[-1] is always current position
+        - self.trail_positions[-2] is last saved position 
+        - self.trail_length is the length of the line through the saved positions
+
+        The current position is saved once a straight line to it from the
+        last saved one would be more than self.trail_accuracy away from
+        the path the body took. For an arc that turns the heading by turn
+        over a chord, that distance is about chord*turn/8, so tight curves
+        get many positions and almost straight paths only a few. The turn
+        is measured between the speed now and at the last saved position.
+
+        The oldest saved positions are dropped
+        while the trail is longer than self.max_trail_length, or has more
+        than TRAIL_CAPACITY of them. trail_positions is a deque, so both
+        ends change in O(1).
+
+        Bodies in a BodyStore keep their trails in its ring buffers
+        (see BodyStore.update_trails()).
+        """
+        if self._store is not None:
+            self._store.update_trails([self._index])
+            return
+
+        # The slots directly, like in drift()
+        trail = self._trail_positions
+        pos_x = self._pos_x
+        pos_y = self._pos_y
+        prev_x, prev_y = trail[-2]
         delta_x = pos_x - prev_x
         delta_y = pos_y - prev_y
-        dist_traveled = sqrt(delta_x**2 + delta_y**2)
-
-        if dist_traveled > self.trail_accuracy:
-            # Save this position
-            self.trail_positions[-1] = self.pos    # [-2] see top method comment
-            
-            # Last item is always current position
-            self.trail_positions.append(self.pos)  # [-1] see top method comment
-            
-            self.trail_length += dist_traveled
-        else:
-            self.trail_positions[-1] = self.pos
-
-        while self.trail_length > self.max_trail_length and len(self.trail_positions) >= 2:
-            first_x, first_y = self.trail_positions[0]
-            secnd_x, secnd_y = self.trail_positions[1]
+        dist_traveled = sqrt(delta_x*delta_x + delta_y*delta_y)
+
+        heading_x = self._trail_heading_x
+        heading_y = self._trail_heading_y
+        speed_x = self._speed_x
+        speed_y = self._speed_y
+        if heading_x == 0 and heading_y == 0:
+            # Was at rest, the heading is the one it starts to move with
+            heading_x = self._trail_heading_x = speed_x
+            heading_y = self._trail_heading_y = speed_y
+        turn = abs(atan2(heading_x*speed_y - heading_y*speed_x, heading_x*speed_x + heading_y*speed_y))
+
+        pos = (pos_x, pos_y)
+        trail[-1] = pos
+        if (dist_traveled*turn/8 > self._trail_accuracy or turn > TRAIL_MAX_TURN
+                or dist_traveled > self._max_trail_length/TRAIL_MIN_SEGMENTS):
+            # Save this position, the last item is still the current position
+            trail.append(pos)
+            self._trail_length += dist_traveled
+            self._trail_heading_x = speed_x
+            self._trail_heading_y = speed_y
+
+        # Drop the oldest saved position and the line from it to the next one
+        while len(trail) > 2 and (self._trail_length > self._max_trail_length
+                                  or len(trail) > TRAIL_CAPACITY + 1):
+            first_x, first_y = trail.popleft()
+            secnd_x, secnd_y = trail[0]
             delta_x = first_x - secnd_x
             delta_y = first_y - secnd_y
-            self.trail_length -= dist_traveled
-            del self.trail_positions[0]
-
-def merge_bodies(body_1: Body, body_2: Body, body_list: list[Body]) -> None:
-    """body_1 eats body_2 in an inelastic collision"""
-    
-    new_mass = body_1.mass + body_2.mass
-    
-    speed_1_x, speed_1_y = body_1.speed
-    speed_2_x, speed_2_y = body_2.speed
+            self._trail_length -= sqrt(delta_x*delta_x + delta_y*delta_y)
+
+def merge_into(body: Body, eaten_bodies: list[Body]) -> None:
+    """body eats all eaten_bodies in one inelastic collision
+
+    The total momentum is kept, so the new speed is the mass weighted
+    average of the speeds. Removing the eaten bodies from the body list
+    is left to the caller, so many merges can share one removal pass.
+    """
+    new_mass = body.mass
+    speed_x, speed_y = body.speed
+    momentum_x = body.mass * speed_x
+    momentum_y = body.mass * speed_y
+
+    for eaten in eaten_bodies:
+        eaten_speed_x, eaten_speed_y = eaten.speed
+        momentum_x += eaten.mass * eaten_speed_x
+        momentum_y += eaten.mass * eaten_speed_y
+        new_mass += eaten.mass
 
     # Set new speeds
-    new_speed_1_x = round(((body_1.mass*speed_1_x) + (body_2.mass * speed_2_x)) / new_mass)
-    new_speed_1_x = round(((body_1.mass*speed_1_y) + (body_2.mass * speed_2_y)) / new_mass)
-    body_1.speed = (new_speed_1_x, new_speed_1_x)
+    body.speed = (momentum_x / new_mass, momentum_y / new_mass)
 
     # Set new mass
-    body_1.mass = new_mass
+    body.mass = new_mass
 
     # Set new radius
-    body_1.radius = round(((body_1.mass/body_1.density)*(3/(4*PI)))**(1/3))
-    
+    body.radius = round(((body.mass/body.density)*(3/(4*PI)))**(1/3))
+
+def merge_bodies(body_1: Body, body_2: Body, body_list: list[Body]) -> None:
+    """body_1 eats body_2 in an inelastic collision"""
+    merge_into(body_1, [body_2])
     body_list.remove(body_2)
 
 def create_bodies(amount: int, mass_min: int, mass_max: int, density: int, dist_origin: int) -> list[Body]:
@@ -265,6 +435,21 @@ def create_bodies(amount: int, mass_min: int, mass_max: int, density: int, dist_
         blocked_areas.append(body_area)
 
         # Add body to list
-        bodies.append(Body(pos_x, pos_y, mass, density))
+        bodies.append(Body(pos_x, pos_y, 0, 0, mass, density))
 
     return bodies
+
+def total_energy(bodies: list[Body]) -> float:
+    """Returns the kinetic plus the gravitational potential energy of all bodies (J)
+
+    Stays (almost) the same over time for a good integrator, so the
+    relative change is a measure of its error. Merges lose energy.
+    """
+    bodies = list(bodies)
+    energy = 0.0
+    for i, body in enumerate(bodies):
+        speed_x, speed_y = body.speed
+        energy += body.mass * (speed_x*speed_x + speed_y*speed_y) / 2  # E_k = m*v²/2
+        for other in bodies[i + 1:]:
+            energy -= G * body.mass * other.mass / body.distance_to(other)  # E_p = -G*m_1*m_2/r
+    return energy
@@ -0,0 +1,536 @@
+# Standard imports
+from collections import deque
+
+# Third party imports
+import numpy as np
+
+# Local imports
+from body import G, TRAIL_CAPACITY, TRAIL_MAX_TURN, TRAIL_MIN_SEGMENTS, Body
+
+
+class BodyStore:
+    """Struct-of-arrays storage for celestial bodies
+
+    All the state the simulation touches every step (positions, speeds,
+    forces, masses, radii and static flags) is kept in contiguous NumPy
+    arrays, so the gravity between all pairs of bodies can be computed in
+    a few broadcast operations instead of nested Python loops.
+
+    The store behaves like the list of bodies it replaces (iterate, index,
+    append, remove), and the Body objects in it become thin views over the
+    arrays. This way draw.py and place_sun() work the same with both.
+
+    The trails are kept here too, as one ring buffer of TRAIL_CAPACITY
+    saved positions per body, so they are all updated at once without
+    moving any points (see update_trails()).
+    """
+    __slots__ = ("bodies", "count", "pos", "speed", "force", "mass", "radius", "static",
+                 "trail_points", "trail_segments", "trail_start", "trail_size",
+                 "trail_length", "max_trail_length", "trail_accuracy", "trail_heading", "far_cache")
+
+    VECTOR_FIELDS = ("pos", "speed", "force")
+    SCALAR_FIELDS = ("mass", "radius", "static")
+
+    # The trail StoreFields of Body, and the arrays behind them
+    TRAIL_FIELDS = ("trail_length", "max_trail_length", "trail_accuracy", "trail_positions",
+                    "trail_heading")
+    TRAIL_ARRAYS = ("trail_points", "trail_segments", "trail_start", "trail_size",
+                    "trail_length", "max_trail_length", "trail_accuracy", "trail_heading")
+
+    # How many rows of the all-pairs matrices to build at a time.
+    # Keeps memory use at block_rows*n instead of n*n for large n.
+    BLOCK_ROWS = 256
+
+    def __init__(self, bodies: list[Body] = (), capacity: int = 16) -> None:
+        self.bodies = []
+        self.count = 0
+        self.pos = np.zeros((capacity, 2))
+        self.speed = np.zeros((capacity, 2))
+        self.force = np.zeros((capacity, 2))
+        self.mass = np.zeros(capacity)
+        self.radius = np.zeros(capacity)
+        self.static = np.zeros(capacity, dtype=bool)
+
+        # Ring buffer of saved trail positions: body i has trail_size[i]
+        # of them, the oldest at trail_points[i, trail_start[i]].
+        # trail_segments[i, k] is the length of the line from the saved
+        # position before k to k, so the oldest can be dropped in O(1).
+        self.trail_points = np.zeros((capacity, TRAIL_CAPACITY, 2))
+        self.trail_segments = np.zeros((capacity, TRAIL_CAPACITY))
+        self.trail_start = np.zeros(capacity, dtype=np.int64)
+        self.trail_size = np.zeros(capacity, dtype=np.int64)
+        self.trail_length = np.zeros(capacity)
+        self.max_trail_length = np.zeros(capacity)
+        self.trail_accuracy = np.zeros(capacity)
+        self.trail_heading = np.zeros((capacity, 2))
+
+        self.far_cache = None  # See compute_cached_forces()
+
+        self.extend(bodies)
+
+    @classmethod
+    def from_arrays(cls, names: list[str], density: np.ndarray, **fields: np.ndarray) -> "BodyStore":
+        """Returns a store with the given field arrays (pos, speed, ...), with a Body view per row
+
+        Much faster than adding bodies one by one for large n, since the
+        values are copied into the store in one go (see checkpoint.py).
+        The bodies have no trails yet, see set_trails().
+        """
+        count = len(names)
+        store = cls(capacity=max(count, 16))
+        for name in cls.VECTOR_FIELDS + cls.SCALAR_FIELDS:
+            getattr(store, name)[:count] = fields[name]
+        store.bodies = [Body.view_of(store, index, name, body_density)
+                        for index, (name, body_density) in enumerate(zip(names, density.tolist()))]
+        store.count = count
+        return store
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self):
+        return iter(self.bodies)
+
+    def __getitem__(self, index):
+        return self.bodies[index]
+
+    def __contains__(self, body) -> bool:
+        return getattr(body, "_store", None) is self
+
+    def index(self, body: Body) -> int:
+        if body not in self:
+            raise ValueError(f"{body.name!r} is not in this BodyStore")
+        return body._index
+
+    def append(self, body: Body) -> None:
+        """Adds body to the store, turning it into a view over the arrays"""
+        if body._store is not None:
+            raise ValueError(f"{body.name!r} is already in a BodyStore")
+
+        if self.count == len(self.mass):
+            self._grow(max(2 * self.count, 16))
+
+        index = self.count
+        for name in self.VECTOR_FIELDS + self.SCALAR_FIELDS + self.TRAIL_FIELDS:
+            self.set_field(name, index, getattr(Body, name).get_local(body))
+
+        body._store = self
+        body._index = index
+        self.bodies.append(body)
+        self.count += 1
+        self.far_cache = None
+
+    def extend(self, bodies: list[Body]) -> None:
+        for body in bodies:
+            self.append(body)
+
+    def remove(self, body: Body) -> None:
+        """Removes body from the store. The body keeps its last values."""
+        index = self.index(body)
+        self._detach(body)
+
+        last = self.count - 1
+        for name in self.VECTOR_FIELDS + self.SCALAR_FIELDS + self.TRAIL_ARRAYS:
+            array = getattr(self, name)
+            array[index:last] = array[index + 1:self.count]
+
+        del self.bodies[index]
+        self.count -= 1
+        self.far_cache = None
+        for moved_body in self.bodies[index:]:
+            moved_body._index -= 1
+
+    def remove_many(self, bodies: list[Body]) -> None:
+        """Removes all the given bodies, compacting the arrays only once"""
+        keep = np.ones(self.count, dtype=bool)
+        for body in bodies:
+            keep[self.index(body)] = False
+        for body in bodies:
+            self._detach(body)
+
+        new_count = int(keep.sum())
+        for name in self.VECTOR_FIELDS + self.SCALAR_FIELDS + self.TRAIL_ARRAYS:
+            array = getattr(self, name)
+            array[:new_count] = array[:self.count][keep]
+
+        self.bodies = [body for body, kept in zip(self.bodies, keep.tolist()) if kept]
+        self.count = new_count
+        self.far_cache = None
+        for index, body in enumerate(self.bodies):
+            body._index = index
+
+    def _detach(self, body: Body) -> None:
+        """Copies the values of body out of the arrays and back onto the body"""
+        values = {name: self.get_field(name, body._index)
+                  for name in self.VECTOR_FIELDS + self.SCALAR_FIELDS + self.TRAIL_FIELDS}
+        values["trail_positions"] = deque(values["trail_positions"])
+        body._store = None
+        body._index = -1
+        for name, value in values.items():
+            getattr(Body, name).set_local(body, value)
+
+    def _grow(self, capacity: int) -> None:
+        for name in self.VECTOR_FIELDS + self.SCALAR_FIELDS + self.TRAIL_ARRAYS:
+            array = getattr(self, name)
+            grown = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+            grown[:self.count] = array[:self.count]
+            setattr(self, name, grown)
+
+    def get_field(self, name: str, index: int):
+        """Returns the value a Body view sees for one of its StoreFields"""
+        if name == "trail_positions":
+            return self.trail_of(index)
+        value = getattr(self, name)[index]
+        if value.ndim == 1:  # VECTOR_FIELDS and trail_heading
+            return tuple(value.tolist())
+        else:
+            return value.item()
+
+    def set_field(self, name: str, index: int, value) -> None:
+        if name == "trail_positions":
+            self.set_trails(np.array([0, len(value)]), np.array(value, dtype=float).reshape(-1, 2),
+                            rows=np.array([index]))
+            return
+        getattr(self, name)[index] = value
+
+    def trail_of(self, index: int) -> list[tuple[float, float]]:
+        """Returns the trail of one body like Body.trail_positions: the saved positions, then the current one"""
+        slots = (self.trail_start[index] + np.arange(self.trail_size[index])) % TRAIL_CAPACITY
+        return list(map(tuple, self.trail_points[index, slots].tolist())) + [tuple(self.pos[index].tolist())]
+
+    def trail_arrays(self) -> tuple[np.ndarray, np.ndarray]:
+        """Returns every trail at once as (offsets, points), like in a checkpoint
+
+        Body i has the trail points[offsets[i]:offsets[i + 1]], which
+        ends with its current position (see trail_of()).
+        """
+        n = self.count
+        sizes = self.trail_size[:n] + 1
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(sizes, out=offsets[1:])
+
+        within = np.arange(TRAIL_CAPACITY)
+        saved = within < self.trail_size[:n, np.newaxis]
+        slots = (self.trail_start[:n, np.newaxis] + within) % TRAIL_CAPACITY
+        points = np.empty((offsets[-1], 2))
+        is_current = np.zeros(offsets[-1], dtype=bool)
+        is_current[offsets[1:] - 1] = True
+        points[~is_current] = self.trail_points[np.arange(n)[:, np.newaxis], slots][saved]
+        points[is_current] = self.pos[:n]
+        return offsets, points
+
+    def set_trails(self, offsets: np.ndarray, points: np.ndarray, rows: np.ndarray = None) -> None:
+        """Sets the trails of rows (default all bodies) from (offsets, points), see trail_arrays()
+
+        The last point of every trail is the current position, which is
+        not saved. Only the newest TRAIL_CAPACITY saved positions are
+        kept, and the lengths are worked out again from them.
+        """
+        if rows is None:
+            rows = np.arange(self.count)
+        # At least one saved position, update_trails() measures from it
+        saved = np.maximum(np.diff(offsets) - 1, 1)
+        kept = np.minimum(saved, TRAIL_CAPACITY)
+        kept_rows = np.repeat(rows, kept)
+        within = np.arange(kept.sum()) - np.repeat(np.cumsum(kept) - kept, kept)
+        source = np.repeat(offsets[:-1] + saved - kept, kept) + within
+
+        self.trail_points[kept_rows, within] = points[source]
+        delta = points[source] - points[source - 1]
+        segments = np.sqrt(np.einsum('ij,ij->i', delta, delta))
+        segments[within == 0] = 0  # The oldest has no line before it
+        self.trail_segments[kept_rows, within] = segments
+        self.trail_start[rows] = 0
+        self.trail_size[rows] = kept
+        self.trail_heading[rows] = self.speed[rows]
+        self.trail_length[rows] = 0
+        np.add.at(self.trail_length, kept_rows, segments)
+
+    def update_trails(self, rows=None) -> None:
+        """Moves the end of every trail (or only of rows) to the current positions
+
+        Same rules as Body.update_trail(), vectorized over all bodies.
+        Saving a position writes one slot of the ring, and dropping the
+        oldest only moves trail_start, so no points are ever moved.
+        """
+        rows = np.arange(self.count) if rows is None else np.asarray(rows)
+        last_slots = (self.trail_start[rows] + self.trail_size[rows] - 1) % TRAIL_CAPACITY
+        delta = self.pos[rows] - self.trail_points[rows, last_slots]
+        dist_traveled = np.sqrt(np.einsum('ij,ij->i', delta, delta))
+
+        heading = self.trail_heading[rows]
+        speed = self.speed[rows]
+        # Was at rest, the heading is the one it starts to move with
+        at_rest = ~heading.any(axis=1)
+        heading[at_rest] = speed[at_rest]
+        self.trail_heading[rows[at_rest]] = speed[at_rest]
+        turn = np.abs(np.arctan2(heading[:, 0]*speed[:, 1] - heading[:, 1]*speed[:, 0],
+                                 np.einsum('ij,ij->i', heading, speed)))
+
+        saving_mask = ((dist_traveled*turn/8 > self.trail_accuracy[rows]) | (turn > TRAIL_MAX_TURN)
+                       | (dist_traveled > self.max_trail_length[rows]/TRAIL_MIN_SEGMENTS))
+        saving = rows[saving_mask]
+        dist_traveled = dist_traveled[saving_mask]
+        if len(saving) > 0:
+            # A full ring drops its oldest first, to make room
+            full = saving[self.trail_size[saving] == TRAIL_CAPACITY]
+            self._drop_oldest(full)
+
+            slots = (self.trail_start[saving] + self.trail_size[saving]) % TRAIL_CAPACITY
+            self.trail_points[saving, slots] = self.pos[saving]
+            self.trail_segments[saving, slots] = dist_traveled
+            self.trail_size[saving] += 1
+            self.trail_length[saving] += dist_traveled
+            self.trail_heading[saving] = self.speed[saving]
+
+        while True:
+            too_long = rows[(self.trail_length[rows] > self.max_trail_length[rows])
+                            & (self.trail_size[rows] >= 2)]
+            if len(too_long) == 0:
+                break
+            self._drop_oldest(too_long)
+
+    def _drop_oldest(self, rows: np.ndarray) -> None:
+        """Drops the oldest saved trail position of rows, and the line from it to the next one"""
+        second = (self.trail_start[rows] + 1) % TRAIL_CAPACITY
+        self.trail_length[rows] -= self.trail_segments[rows, second]
+        self.trail_segments[rows, second] = 0
+        self.trail_start[rows] = second
+        self.trail_size[rows] -= 1
+
+    def _pair_blocks(self, rows=None):
+        """Yields (block, delta_x, delta_y, dist) for blocks of rows of the all-pairs matrices
+
+        block is the body indices of the rows in this block, and
+        (delta_x[i, j], delta_y[i, j]) is the vector from body block[i]
+        towards body j, and dist[i, j] is the length of that vector.
+        Only the given rows are used if rows is not None.
+        """
+        pos_x = self.pos[:self.count, 0]
+        pos_y = self.pos[:self.count, 1]
+        if rows is None:
+            rows = np.arange(self.count)
+        for start in range(0, len(rows), self.BLOCK_ROWS):
+            block = rows[start:start + self.BLOCK_ROWS]
+            delta_x = pos_x[np.newaxis, :] - pos_x[block, np.newaxis]
+            delta_y = pos_y[np.newaxis, :] - pos_y[block, np.newaxis]
+            dist = np.sqrt(delta_x*delta_x + delta_y*delta_y)
+            yield block, delta_x, delta_y, dist
+
+    def compute_forces(self, rows=None) -> None:
+        """Sets the gravitational force on every body from all the other bodies
+
+        If rows (body indices) is given, only the force on those bodies is set.
+        """
+        n = self.count
+        if rows is None:
+            rows = np.arange(n)
+        set_forces_on_rows(self.pos[:n], self.mass[:n], self.radius[:n], rows, self.force)
+
+    def compute_cached_forces(self, rows=None) -> None:
+        """Same as compute_forces(), but only updates the strong pulls on every call
+
+        For every body, the pulls from the other bodies are split into
+        near (at least FarForceCache.NEAR_FRACTION of its strongest pull)
+        and far. The far part barely changes from step to step, so its sum
+        is kept in a per-body cache, and only refreshed every
+        FarForceCache.REFRESH_STEPS calls or when the body has moved too
+        far since. The near part is computed every call. For init_bodies()
+        that means only the pulls to and from the Sun, O(n) instead of O(n²).
+
+        The cache is thrown away when bodies are added or removed.
+        """
+        if rows is None:
+            rows = np.arange(self.count)
+        rows = np.asarray(rows, dtype=int)
+
+        if self.far_cache is None:
+            self.far_cache = FarForceCache(self.count)
+            self._refresh_far_forces(np.arange(self.count))
+        else:
+            cache = self.far_cache
+            moved = np.hypot(*(self.pos[rows] - cache.pos[rows]).T)
+            stale = ((cache.age[rows] >= FarForceCache.REFRESH_STEPS) |
+                     (moved > FarForceCache.MOVE_FRACTION * cache.far_dist[rows]))
+            if stale.any():
+                self._refresh_far_forces(rows[stale])
+
+        cache = self.far_cache
+        near_force = self._near_forces(rows)
+        self.force[rows] = cache.force[rows] + near_force
+        cache.age[rows] += 1
+
+    def _near_forces(self, rows: np.ndarray) -> np.ndarray:
+        """Returns the force on every body in rows from its near bodies"""
+        cache = self.far_cache
+        in_rows = np.zeros(self.count, dtype=bool)
+        in_rows[rows] = True
+        selected = in_rows[cache.near_i]
+        near_i = cache.near_i[selected]
+        near_j = cache.near_j[selected]
+
+        delta = self.pos[near_j] - self.pos[near_i]
+        dist = np.hypot(delta[:, 0], delta[:, 1])
+        radius = self.radius[:self.count]
+        apart = (dist > radius[near_i]) & (dist > radius[near_j])
+        weight = np.divide(G * self.mass[near_i] * self.mass[near_j], dist**3,
+                           out=np.zeros_like(dist), where=apart)
+
+        force = np.zeros((self.count, 2))
+        np.add.at(force, near_i, weight[:, np.newaxis] * delta)
+        return force[rows]
+
+    def _refresh_far_forces(self, rows: np.ndarray) -> None:
+        """Splits the pulls on the bodies in rows into near and far, and caches the far sum"""
+        cache = self.far_cache
+        n = self.count
+        mass = self.mass[:n]
+        radius = self.radius[:n]
+        new_i = []
+        new_j = []
+
+        for block, delta_x, delta_y, dist in self._pair_blocks(rows):
+            apart = (dist > radius[block, np.newaxis]) & (dist > radius[np.newaxis, :])
+            weight = np.divide(mass[np.newaxis, :], dist**3,
+                               out=np.zeros_like(dist), where=apart)
+            pull = weight * dist  # G*m_j/r² without the G
+            near = pull >= FarForceCache.NEAR_FRACTION * pull.max(axis=1, initial=0)[:, np.newaxis]
+            near &= pull > 0
+
+            far_weight = np.where(near, 0, weight)
+            gm = G * mass[block]
+            cache.force[block, 0] = gm * (far_weight*delta_x).sum(axis=1)
+            cache.force[block, 1] = gm * (far_weight*delta_y).sum(axis=1)
+
+            far_dist = np.where(near | ~apart, np.inf, dist)
+            cache.far_dist[block] = far_dist.min(axis=1)
+
+            block_i, block_j = np.nonzero(near)
+            new_i.append(block[block_i])
+            new_j.append(block_j)
+
+        # Replace the near pairs of the refreshed rows
+        refreshed = np.zeros(n, dtype=bool)
+        refreshed[rows] = True
+        keep = ~refreshed[cache.near_i]
+        cache.near_i = np.concatenate([cache.near_i[keep]] + new_i)
+        cache.near_j = np.concatenate([cache.near_j[keep]] + new_j)
+
+        cache.pos[rows] = self.pos[rows]
+        cache.age[rows] = 0
+
+    def encounter_timescales(self) -> np.ndarray:
+        """Returns the shortest sqrt(r³/(G*(m_i + m_j))) from every body to any other body
+
+        This is about how long the closest (by gravity) other body takes
+        to move the body a noticeable amount, which is what the time bins
+        of integrators.step_block() are based on.
+        """
+        n = self.count
+        mass = self.mass[:n]
+        timescales = np.full(n, np.inf)
+
+        for block, delta_x, delta_y, dist in self._pair_blocks():
+            mass_sum = mass[block, np.newaxis] + mass[np.newaxis, :]
+            timescale = np.sqrt(np.divide(dist*dist*dist, G * mass_sum,
+                                          out=np.full_like(dist, np.inf), where=dist > 0))
+            timescales[block] = timescale.min(axis=1)
+
+        return timescales
+
+    def colliding_pairs(self) -> list[tuple[Body, Body]]:
+        """Returns all pairs of bodies which have collided with each other
+
+        Same sweep and prune on x as collision.candidate_pairs(), but with
+        arrays: after sorting the bodies on the left edge of their x
+        interval, the bodies that can overlap body i are the ones sorted
+        after it, up to the first one starting right of its right edge.
+        """
+        n = self.count
+        pos = self.pos[:n]
+        radius = self.radius[:n]
+
+        left = pos[:, 0] - radius
+        order = np.argsort(left, kind='stable')
+        sorted_left = left[order]
+        sorted_right = (pos[:, 0] + radius)[order]
+
+        # Number of x-overlap candidates after every sorted body
+        ends = np.searchsorted(sorted_left, sorted_right, side='right')
+        counts = np.maximum(ends - np.arange(1, n + 1), 0)
+        if counts.sum() == 0:
+            return []
+
+        # All (first, second) positions in sorted order, first < second
+        first = np.repeat(np.arange(n), counts)
+        offsets = np.arange(len(first)) - np.repeat(np.cumsum(counts) - counts, counts)
+        second = first + 1 + offsets
+        first = order[first]
+        second = order[second]
+
+        # Exact test, same as Body.collision_with()
+        delta = pos[first] - pos[second]
+        dist = np.sqrt(np.einsum('ij,ij->i', delta, delta))
+        touching = (dist <= radius[first]) | (dist <= radius[second])
+
+        return [(self.bodies[i], self.bodies[j]) for i, j in
+                zip(first[touching].tolist(), second[touching].tolist())]
+
+    def drift(self, time: int | float) -> None:
+        """Moves every non-static body along its speed for the given time"""
+        n = self.count
+        moving = ~self.static[:n]
+        self.pos[:n][moving] += self.speed[:n][moving] * time  # s = v*t
+
+    def kick(self, time: int | float, rows=None) -> None:
+        """Changes the speed of every body (or only rows) by its force over the given time"""
+        if rows is None:
+            rows = slice(0, self.count)
+        self.speed[rows] += self.force[rows] / self.mass[rows, np.newaxis] * time  # v = v_0 + a*t
+
+def set_forces_on_rows(pos: np.ndarray, mass: np.ndarray, radius: np.ndarray,
+                       rows: np.ndarray, force: np.ndarray) -> None:
+    """Sets force[rows] to the gravitational force on those bodies from all bodies
+
+    The arrays are the first count rows of the BodyStore arrays. Kept
+    outside of BodyStore so the worker processes in parallel.py can run
+    it on arrays in shared memory.
+    """
+    pos_x = pos[:, 0]
+    pos_y = pos[:, 1]
+    for start in range(0, len(rows), BodyStore.BLOCK_ROWS):
+        block = rows[start:start + BodyStore.BLOCK_ROWS]
+        delta_x = pos_x[np.newaxis, :] - pos_x[block, np.newaxis]
+        delta_y = pos_y[np.newaxis, :] - pos_y[block, np.newaxis]
+        dist = np.sqrt(delta_x*delta_x + delta_y*delta_y)
+
+        # Bodies that have collided (and every body with itself) don't
+        # pull on each other, same as in Body.force_from()
+        apart = (dist > radius[block, np.newaxis]) & (dist > radius[np.newaxis, :])
+
+        # F_i = G * m_i * sum_j(m_j * delta_ij / |delta_ij|³)
+        weight = np.divide(mass[np.newaxis, :], dist*dist*dist,
+                           out=np.zeros_like(dist), where=apart)
+        gm = G * mass[block]
+        force[block, 0] = gm * (weight*delta_x).sum(axis=1)
+        force[block, 1] = gm * (weight*delta_y).sum(axis=1)
+
+class FarForceCache:
+    """Cached far-field forces of a BodyStore (see BodyStore.compute_cached_forces())"""
+    __slots__ = ("force", "pos", "far_dist", "age", "near_i", "near_j")
+
+    # A pull is near if it is at least this fraction of the strongest pull on the body
+    NEAR_FRACTION = 0.01
+
+    # Refresh the far force of a body after this many calls, or when it has
+    # moved this fraction of the distance to its closest far body
+    REFRESH_STEPS = 10
+    MOVE_FRACTION = 0.05
+
+    def __init__(self, count: int) -> None:
+        self.force = np.zeros((count, 2))      # Sum of the far pulls on every body
+        self.pos = np.zeros((count, 2))        # Positions when the far force was computed
+        self.far_dist = np.zeros(count)        # Distance to the closest far body back then
+        self.age = np.zeros(count, dtype=int)  # Calls since the far force was computed
+        self.near_i = np.zeros(0, dtype=int)   # Near pairs, body near_i is pulled by near_j
+        self.near_j = np.zeros(0, dtype=int)
@@ -0,0 +1,76 @@
+# The parts of a frame, from the bottom to the top. Every canvas item
+# is tagged with its part, so new items can be put in their place.
+DRAW_ORDER = ("background", "particle", "trail", "body", "name",
+              "time", "sim_info", "timeline", "timeline_marker", "controls", "paused")
+
+# The parts that belong to a body, deleted when the body is gone
+BODY_PARTS = ("trail", "body", "name")
+
+
+class CanvasItems:
+    """The canvas items of the last frame, to be moved instead of drawn again
+
+    Without it, every frame deletes every canvas item and makes them all
+    again, and making items is the slowest thing Tk does once there are
+    a few hundred bodies. Here every item is made once, the first time
+    its (owner, part) is drawn, and after that only moved with coords()
+    or changed with itemconfigure(), and only if something changed. An
+    item that isn't drawn in a frame is hidden, and the items of a body
+    are only deleted once the body is gone (eaten or loaded over).
+
+    Needs an App with retained_drawing, so the canvas is not cleared
+    before every redraw_all(). It is kept on the canvas (see
+    canvas_items_of() in draw.py).
+    """
+    __slots__ = ("items", "used", "hidden", "created")
+
+    def __init__(self) -> None:
+        self.items = {}       # (owner, part) -> [item id, coords, options]
+        self.used = set()     # Keys drawn since the last finish()
+        self.hidden = set()   # Keys of the items that are hidden
+        self.created = False  # If an item was made since the last finish()
+
+    def draw(self, canvas, owner, part: str, kind: str, coords, options: dict) -> None:
+        """Makes or moves the item (owner, part), like canvas.create_<kind>(*coords, **options)"""
+        key = (owner, part)
+        self.used.add(key)
+        item = self.items.get(key)
+        if item is None:
+            item_id = getattr(canvas, "create_" + kind)(*coords, tags=part, **options)
+            self.items[key] = [item_id, coords, options]
+            self.created = True
+            return
+
+        item_id, old_coords, old_options = item
+        if coords != old_coords:
+            canvas.coords(item_id, *coords)
+            item[1] = coords
+        if key in self.hidden:
+            self.hidden.discard(key)
+            canvas.itemconfigure(item_id, state='normal', **options)
+            item[2] = options
+        elif options != old_options:
+            canvas.itemconfigure(item_id, **options)
+            item[2] = options
+
+    def finish(self, canvas, owners: set) -> None:
+        """Hides or deletes the items that were not drawn this frame
+
+        owners is the owners (see trail_key() in draw.py) of every body
+        that is still there. The BODY_PARTS items of the other ones are
+        deleted, the rest are hidden until they are drawn again.
+        """
+        for key in self.items.keys() - self.used:
+            owner, part = key
+            if part in BODY_PARTS and owner not in owners:
+                canvas.delete(self.items.pop(key)[0])
+                self.hidden.discard(key)
+            elif key not in self.hidden:
+                canvas.itemconfigure(self.items[key][0], state='hidden')
+                self.hidden.add(key)
+
+        if self.created:
+            for part in DRAW_ORDER:
+                canvas.tag_raise(part)
+        self.used.clear()
+        self.created = False
@@ -0,0 +1,111 @@
+# Third party imports
+import numpy as np
+
+# Local imports
+from body import Body
+from body_store import BodyStore
+from particles import Particles
+from integrators import new_integrator_cache
+
+# Increased whenever the layout (see save_checkpoint()) changes
+CHECKPOINT_VERSION = 1
+
+# Default file for the save and load keys (see control.py)
+CHECKPOINT_PATH = "checkpoint.npz"
+
+# Settings of the app that are saved as they are, and put back on load.
+# The force mode is not one of them, it depends on what the machine has.
+SETTINGS = ("sim_sec_passed", "integrator", "tolerance", "theta", "MAX_TIME_TO_SIM", "num_of_new_suns",
+            "desired_simrate", "sec_to_sim_per_sec", "sec_to_sim_per_frame", "actual_simrate")
+
+
+def save_checkpoint(app, path: str) -> None:
+    """Saves the whole simulation state of app (or a headless state) to an .npz file
+
+    Layout, n bodies with m trail points in total:
+        version                 CHECKPOINT_VERSION
+        name, density           (n,) body names and densities
+        pos, speed, force       (n, 2) float64, SI units
+        mass, radius            (n,) float64
+        static                  (n,) bool
+        sun                     Index of app.sun, -1 if it has been eaten
+        trail_offsets           (n + 1,) body i has the trail points
+                                trail_points[trail_offsets[i]:trail_offsets[i + 1]]
+        trail_points            (m, 2) float64
+        trail_length, max_trail_length, trail_accuracy   (n,) float64
+        trail_heading           (n, 2) float64
+        particle_pos, particle_speed   (p, 2) float64, only with particles
+        One 0-d array per name in SETTINGS (sim time, integrator, simrate ...)
+
+    The bodies are in a BodyStore, as they always are with NumPy (see
+    init_simulation() in simulation.py). Uncompressed, so it loads about
+    as fast as the disk can read. Stop a background worker first (see
+    save_simulation() in simulation.py).
+    """
+    bodies = app.bodies
+    particles = app.particles
+    body_list = list(bodies)
+
+    n = bodies.count
+    arrays = {name: getattr(bodies, name)[:n] for name in BodyStore.VECTOR_FIELDS + BodyStore.SCALAR_FIELDS}
+    trail_offsets, trail_points = bodies.trail_arrays()
+
+    if particles is not None:
+        arrays["particle_pos"] = particles.pos
+        arrays["particle_speed"] = particles.speed
+
+    sun = next((index for index, body in enumerate(body_list) if body is app.sun), -1)
+    np.savez(path,
+             version=CHECKPOINT_VERSION,
+             name=np.array([body.name for body in body_list], dtype=str),
+             density=np.array([body.density for body in body_list], dtype=float),
+             sun=sun,
+             trail_offsets=trail_offsets,
+             trail_points=trail_points,
+             trail_length=bodies.trail_length[:n],
+             max_trail_length=bodies.max_trail_length[:n],
+             trail_accuracy=bodies.trail_accuracy[:n],
+             trail_heading=bodies.trail_heading[:n],
+             **arrays,
+             **{name: getattr(app, name) for name in SETTINGS})
+
+def load_checkpoint(app, path: str) -> None:
+    """Replaces the simulation state of app (or a headless state) with a checkpoint
+
+    The bodies are put in a new BodyStore. Stop a background worker
+    first (see restore_simulation() in simulation.py).
+    """
+    with np.load(path) as data:
+        version = int(data["version"])
+        if version != CHECKPOINT_VERSION:
+            raise ValueError(f"{path} is checkpoint version {version}, "
+                             f"this version reads {CHECKPOINT_VERSION}")
+
+        n = len(data["name"])
+        fields = {name: data[name] for name in BodyStore.VECTOR_FIELDS + BodyStore.SCALAR_FIELDS}
+        bodies = BodyStore.from_arrays(data["name"].tolist(), data["density"], **fields)
+        bodies.set_trails(data["trail_offsets"], data["trail_points"])
+        # The saved lengths, not the ones set_trails() worked out
+        # again, so the run goes on exactly as it would have
+        bodies.trail_length[:n] = data["trail_length"]
+        bodies.max_trail_length[:n] = data["max_trail_length"]
+        bodies.trail_accuracy[:n] = data["trail_accuracy"]
+        bodies.trail_heading[:n] = data["trail_heading"]
+
+        for name in SETTINGS:
+            setattr(app, name, data[name].item())
+        # Nothing the integrator kept is for these bodies
+        app.integrator_cache = new_integrator_cache(app.integrator)
+
+        app.bodies = bodies
+        sun = int(data["sun"])
+        # If the Sun was eaten, keep a detached Sun so place_sun() still works
+        app.sun = bodies[sun] if sun >= 0 else Body(0, 0, 0, 0, 1, 1, "Sun")
+        if "particle_pos" in data:
+            app.particles = Particles(data["particle_pos"], data["particle_speed"])
+            app.particles.update_accelerations(app.bodies)
+        else:
+            app.particles = None
+
+    # Measure the simrate from here, not across the jump in sim time
+    app.prev_sim_sec_passed = app.sim_sec_passed
@@ -0,0 +1,97 @@
+# Local imports
+from body import Body, merge_into
+
+try:
+    from body_store import BodyStore
+except ModuleNotFoundError:
+    BodyStore = None  # NumPy is not installed
+
+
+def candidate_pairs(bodies: list[Body]) -> list[tuple[int, int]]:
+    """Returns index pairs of bodies that might have collided (broad-phase)
+
+    Sweep and prune on x: Every body covers [x - radius, x + radius] on
+    the x axis, and two bodies can only have collided if these intervals
+    overlap (and the same on the y axis). The bodies are swept from left
+    to right, only keeping the ones whose interval is still open, so
+    bodies far apart are never compared.
+
+    More info: https://en.wikipedia.org/wiki/Sweep_and_prune
+    """
+    pos_x = []
+    pos_y = []
+    radius = []
+    for body in bodies:
+        x, y = body.pos
+        pos_x.append(x)
+        pos_y.append(y)
+        radius.append(body.radius)
+
+    order = sorted(range(len(radius)), key=lambda i: pos_x[i] - radius[i])
+    candidates = []
+    active = []
+
+    for i in order:
+        left = pos_x[i] - radius[i]
+        active = [j for j in active if pos_x[j] + radius[j] >= left]
+
+        for j in active:
+            if abs(pos_y[i] - pos_y[j]) <= radius[i] + radius[j]:
+                candidates.append((j, i) if j < i else (i, j))
+
+        active.append(i)
+
+    return candidates
+
+def collision_groups(colliding: list[tuple[Body, Body]]) -> list[list[Body]]:
+    """Returns the groups of bodies that are connected through collisions
+
+    If A hits B and B hits C, then A, B and C are one group, even if A and
+    C never touched. Uses union-find on the ids of the bodies.
+    """
+    parent = {}
+    bodies = {}
+
+    def find(key):
+        root = key
+        while parent[root] != root:
+            root = parent[root]
+        while parent[key] != root:  # Point everything on the way to the root
+            parent[key], key = root, parent[key]
+        return root
+
+    for body_1, body_2 in colliding:
+        for body in (body_1, body_2):
+            if id(body) not in parent:
+                parent[id(body)] = id(body)
+                bodies[id(body)] = body
+        root_1 = find(id(body_1))
+        root_2 = find(id(body_2))
+        if root_1 != root_2:
+            parent[root_2] = root_1
+
+    groups = {}
+    for key, body in bodies.items():
+        groups.setdefault(find(key), []).append(body)
+    return list(groups.values())
+
+def resolve_collisions(colliding: list[tuple[Body, Body]], bodies) -> None:
+    """Merges every group of collided bodies into its heaviest body
+
+    All groups are merged first, and then the eaten bodies are removed
+    from bodies in one pass, instead of one list.remove() per merge.
+    """
+    eaten = set()
+    for group in collision_groups(colliding):
+        heaviest = max(group, key=lambda body: body.mass)
+        others = [body for body in group if body is not heaviest]
+        merge_into(heaviest, others)
+        eaten.update(id(body) for body in others)
+
+    if not eaten:
+        return
+
+    if BodyStore is not None and isinstance(bodies, BodyStore):
+        bodies.remove_many([body for body in bodies if id(body) in eaten])
+    else:
+        bodies[:] = [body for body in bodies if id(body) not in eaten]
@@ -1,10 +1,21 @@
 # Standard imports
 import platform
+from warnings import warn
 
 # Local imports
 from uib_inf100_graphics import *
 from view import move_view, zoom_view
-from simulation import change_desired_simrate, pause_sim, unpause_sim, place_sun
+from simulation import (change_desired_simrate, pause_sim, unpause_sim, place_sun, toggle_barnes_hut,
+                        save_simulation, restore_simulation)
+from draw import is_on_timeline, timeline_fraction
+from general import model_changed
+
+try:
+    from checkpoint import CHECKPOINT_PATH
+    from replay import scrub_replay, skip_replay
+except ModuleNotFoundError:
+    CHECKPOINT_PATH = None  # NumPy is not installed, the save and load keys do nothing
+    scrub_replay = skip_replay = None  # And there is never a replay to scrub or skip
 
 
 def init_control(app) -> None:
@@ -33,16 +44,37 @@ def init_control(app) -> None:
     # Change mouse pull rate
     app.mouse_movedDelay = 1  # Milliseconds
 
+    # True while the replay timeline is being dragged
+    app.scrubbing = False
+
 def right_mouse_released(app, event) -> None:
+    model_changed(app)
     place_sun(app, (event.x, event.y))
 
+def mouse_pressed(app, event) -> None:
+    model_changed(app)
+    # Grabbing the replay timeline jumps in time instead of moving the view
+    app.scrubbing = app.replay is not None and is_on_timeline(app, (event.x, event.y))
+    if app.scrubbing:
+        scrub_replay(app, timeline_fraction(app, event.x))
+
+def mouse_released(app, event) -> None:
+    model_changed(app)
+    app.scrubbing = False
+
 def mouse_dragged(app, event) -> None:
-    move_view(app, event)
+    model_changed(app)
+    if app.scrubbing:
+        scrub_replay(app, timeline_fraction(app, event.x))
+    else:
+        move_view(app, event)
 
 def mouse_wheel_scrolled(app, event) -> None:
+    model_changed(app)
     zoom_view(app, event)
 
 def key_pressed(app, event) -> None:
+    model_changed(app)
     # Simrate change
     if event.key == '+':
         change_desired_simrate(app, 'increase')
@@ -56,6 +88,25 @@ def key_pressed(app, event) -> None:
         else:
             unpause_sim(app)
 
+    # Force mode change
+    if event.key == 'b':
+        toggle_barnes_hut(app)
+
+    # Checkpoints (see checkpoint.py), not of a replay
+    if event.key in ('s', 'l') and CHECKPOINT_PATH is None:
+        warn("Checkpoints need NumPy (pip install numpy)")
+    elif event.key == 's' and app.replay is None:
+        save_simulation(app, CHECKPOINT_PATH)
+    elif event.key == 'l' and app.replay is None:
+        restore_simulation(app, CHECKPOINT_PATH)
+
+    # Replay skipping (see replay.py)
+    if event.key == 'Left' and app.replay is not None:
+        skip_replay(app, -1)
+
+    if event.key == 'Right' and app.replay is not None:
+        skip_replay(app, 1)
+
 
 # FOR FUTURE USE:
 # def size_changed(app):
@@ -66,11 +117,5 @@ def key_pressed(app, event) -> None:
 # def right_mouse_pressed(app, event) -> None:
 #     pass
 #
-# def mouse_pressed(app, event) -> None:
-#     pass
-#
-# def mouse_released(app, event) -> None:
-#     pass
-#
 # def mouse_moved(app, event) -> None:
 #     pass
\ No newline at end of file
@@ -5,8 +5,37 @@ from math import atan2, cos, sin
 from body import Body
 from view import pos_to_pix
 from general import sec_to_practical_time_string
+from trail_cache import TrailCache
+from canvas_items import CanvasItems
 
 
+def draw_item(app, canvas, owner, part: str, kind: str, coords, **options) -> None:
+    """Draws a canvas item, like canvas.create_<kind>(*coords, **options)
+
+    With retained drawing (see canvas_items.py), the item that owner
+    (a body key or 'hud') had for part in the last frame is moved
+    instead of making a new one.
+    """
+    items = canvas_items_of(app, canvas)
+    if items is None:
+        getattr(canvas, "create_" + kind)(*coords, **options)
+    else:
+        items.draw(canvas, owner, part, kind, coords, options)
+
+def canvas_items_of(app, canvas) -> CanvasItems | None:
+    """Returns the items on canvas from the last frame, or None without retained drawing
+
+    Like the trail cache (see trail_cache_of()), they are view state
+    that every redraw_all() changes, so they are kept on the canvas they
+    belong to, and not on the app with the model.
+    """
+    if not app.retained_drawing:
+        return None
+    items = getattr(canvas, "canvas_items", None)
+    if items is None:
+        items = canvas.canvas_items = CanvasItems()
+    return items
+
 def draw_body(app, canvas, body: Body) -> None:
     """Draws a white circle representing the body.
 
@@ -22,7 +51,7 @@ def draw_body(app, canvas, body: Body) -> None:
     x1 = pixel_pos[0] + body.radius*app.view_zoom
     y1 = pixel_pos[1] - body.radius*app.view_zoom
 
-    canvas.create_oval(x0,y0,x1,y1, fill='white', outline='')
+    draw_item(app, canvas, trail_key(body), 'body', 'oval', (x0,y0,x1,y1), fill='white', outline='')
 
 def draw_force(app, canvas, body: Body) -> None:
     # Not in use. Doesn't look good as is
@@ -50,12 +79,15 @@ def draw_force(app, canvas, body: Body) -> None:
         start_pix = pos_to_pix(app, start)
         end_pix = pos_to_pix(app, end)
         
-        canvas.create_line(start_pix[0], start_pix[1], 
-                           end_pix[0], end_pix[1], 
-                           fill='red',arrow='last')
+        draw_item(app, canvas, trail_key(body), 'force', 'line',
+                  (start_pix[0], start_pix[1], end_pix[0], end_pix[1]),
+                  fill='red',arrow='last')
 
 def draw_trail(app, canvas, body: Body) -> None:
-    """Draws a green line representing the body's trail.
+    """Draws a green line representing the body's trail, if part of it is in frame.
+
+    Only the points needed at the current zoom are drawn
+    (see trail_cache.py).
 
     Args:
         body: A Body object which will be used
@@ -63,13 +95,63 @@ def draw_trail(app, canvas, body: Body) -> None:
         canvas: Frame to draw on
         app: Containg canvas
     """
+    points, (min_x, min_y, max_x, max_y) = trail_cache_of(canvas).simplified(
+        trail_key(body), body.trail_positions, app.view_zoom)
+
+    # Skip the trail if the box around it is out of frame
+    left, top = pos_to_pix(app, (min_x, max_y))
+    right, bottom = pos_to_pix(app, (max_x, min_y))
+    if right < 0 or left > app.width or bottom < 0 or top > app.height:
+        return
+
     pix_list = []
     # Convert the trail positons to pixel coords
-    for pos in body.trail_positions:
+    for pos in points:
         pix = pos_to_pix(app, pos)
         pix_list.append(pix)
 
-    canvas.create_line(pix_list, fill='green')
+    for pix in pix_list:
+        if is_in_frame(app, pix):
+            draw_item(app, canvas, trail_key(body), 'trail', 'line', pix_list, fill='green')
+            break
+
+def trail_cache_of(canvas) -> TrailCache:
+    """Returns the simplified trails drawn on canvas, kept from frame to frame
+
+    The cache is view state that every redraw_all() changes, so it is
+    kept on the canvas, and not on the app with the model that the MVC
+    check compares.
+    """
+    cache = getattr(canvas, "trail_cache", None)
+    if cache is None:
+        cache = canvas.trail_cache = TrailCache()
+    return cache
+
+def trail_key(body):
+    """Returns what the trail of body is cached by, the same from frame to frame
+
+    Snapshots (see background.py and replay.py) are new objects every
+    frame, so they carry the key of the body they were taken of.
+    """
+    return getattr(body, "key", body)
+
+# Drawing a canvas item for each of tens of thousands of particles would
+# take longer than simulating them, so only every n-th is drawn
+MAX_DRAWN_PARTICLES = 2000
+
+def draw_particles(app, canvas, pos) -> None:
+    """Draws the massless particles (see particles.py) at pos as grey dots"""
+    stride = max(1, len(pos) // MAX_DRAWN_PARTICLES)
+
+    # Same as pos_to_pix(), but for all particles at once
+    origin_pix_x, origin_pix_y = app.origin_pix
+    pix_x = (origin_pix_x + pos[::stride, 0]*app.view_zoom).tolist()
+    pix_y = (origin_pix_y - pos[::stride, 1]*app.view_zoom).tolist()
+
+    for number, (x, y) in enumerate(zip(pix_x, pix_y)):
+        if is_in_frame(app, (x, y)):
+            draw_item(app, canvas, number, 'particle', 'rectangle', (x, y, x + 1, y + 1),
+                      fill='grey', outline='')
 
 def draw_name(app, canvas, body: Body) -> None:
     """Draws the name of the body above it"""
@@ -78,10 +160,10 @@ def draw_name(app, canvas, body: Body) -> None:
     text_x = text_pos[0]
     text_y = text_pos[1] - 12
 
-    canvas.create_text(text_x, text_y,
-                       text=body.name, 
-                       font=('Helvetica', 8, 'bold'), 
-                       fill='white', justify='center')
+    draw_item(app, canvas, trail_key(body), 'name', 'text', (text_x, text_y),
+              text=body.name,
+              font=('Helvetica', 8, 'bold'),
+              fill='white', justify='center')
 
 def draw_time_passed(app, canvas) -> None:
     y = (int(app.sim_sec_passed) // (60*60*24*365))
@@ -90,22 +172,50 @@ def draw_time_passed(app, canvas) -> None:
     m = (int(app.sim_sec_passed) // 60) % 60
     s = (int(app.sim_sec_passed)) % 60
 
-    canvas.create_text(app.width/2, 25,
-                       text=(f'{y:>4} years | {d:>3} days | ' 
-                             f'{h:>2} hours {m:>2} min {s:>2} sec'), 
-                       font=('Courier', 10, 'bold'), 
-                       fill='white', justify='center')
+    draw_item(app, canvas, 'hud', 'time', 'text', (app.width/2, 25),
+              text=(f'{y:>4} years | {d:>3} days | '
+                    f'{h:>2} hours {m:>2} min {s:>2} sec'),
+              font=('Courier', 10, 'bold'),
+              fill='white', justify='center')
 
 def draw_sim_info(app, canvas) -> None:
     fps = int(app.frames_per_sec)
 
     simrate = sec_to_practical_time_string(app.desired_simrate)
 
-    canvas.create_text(app.width-100, 40,
-                       text=(f'Simrate: {simrate} per 1s\n'
-                             f'FPS :{fps}'), 
-                       font=('Helvetica', 10, 'bold'), 
-                       fill='white', justify='right')
+    draw_item(app, canvas, 'hud', 'sim_info', 'text', (app.width-100, 40),
+              text=(f'Simrate: {simrate} per 1s\n'
+                    f'FPS :{fps}\n'
+                    f'Gravity: {app.force_mode}'),
+              font=('Helvetica', 10, 'bold'),
+              fill='white', justify='right')
+
+# The replay timeline along the bottom of the window
+TIMELINE_MARGIN = 50  # Pixels from the left and right edge
+TIMELINE_BOTTOM = 14  # Pixels from the bottom edge
+TIMELINE_GRAB = 10    # Pixels above and below the line that still grab it
+
+def draw_timeline(app, canvas) -> None:
+    """Draws the replay timeline, with a marker at the current time"""
+    replay = app.replay
+    length = max(replay.end - replay.start, 1)
+    x0 = TIMELINE_MARGIN
+    x1 = app.width - TIMELINE_MARGIN
+    y = app.height - TIMELINE_BOTTOM
+    marker_x = x0 + (x1 - x0) * (replay.time - replay.start) / length
+
+    draw_item(app, canvas, 'hud', 'timeline', 'line', (x0, y, x1, y), fill='grey', width=2)
+    draw_item(app, canvas, 'hud', 'timeline_marker', 'rectangle',
+              (marker_x - 3, y - 6, marker_x + 3, y + 6), fill='white', outline='')
+
+def is_on_timeline(app, pix: tuple[int, int]) -> bool:
+    """Return true if pix (x,y) is close enough to the timeline to grab it"""
+    return abs(pix[1] - (app.height - TIMELINE_BOTTOM)) <= TIMELINE_GRAB
+
+def timeline_fraction(app, pix_x: int) -> float:
+    """Returns how far along the timeline (0 to 1) the pixel column pix_x is"""
+    fraction = (pix_x - TIMELINE_MARGIN) / (app.width - 2*TIMELINE_MARGIN)
+    return min(max(fraction, 0), 1)
 
 def is_in_frame(app, pos: tuple[int, int]) -> bool:
     """Return true if pos (x,y) is in app frame"""
@@ -119,18 +229,24 @@ def is_in_frame(app, pos: tuple[int, int]) -> bool:
 def redraw_all(app, canvas) -> None:
     """Called everytime any app variable is changed"""
     # Background
-    canvas.create_rectangle(0,0,app.width, app.height, fill='black')
+    draw_item(app, canvas, 'hud', 'background', 'rectangle', (0,0,app.width, app.height), fill='black')
+
+    # With a background worker or a replay, draw its latest
+    # snapshot (see background.py and replay.py)
+    if app.snapshot is not None:
+        bodies = app.snapshot.bodies
+        particle_pos = app.snapshot.particle_pos
+    else:
+        bodies = app.bodies
+        particle_pos = None if app.particles is None else app.particles.pos
 
-    for body in app.bodies:
+    if particle_pos is not None:
+        draw_particles(app, canvas, particle_pos)
+
+    for body in bodies:
         
-        # Check if part of trail is in frame and draw if it is
-        for point in body.trail_positions:
-            point_pix = pos_to_pix(app, point)
-            if is_in_frame(app, point_pix):
-                draw_trail(app, canvas, body)
-                break
-            else:
-                continue
+        # Draw trail if part of it is in frame
+        draw_trail(app, canvas, body)
 
         # Check if body is in frame and draw if it is
         body_coverage = (body.pos[0] + body.radius, body.pos[1] + body.radius)
@@ -141,20 +257,34 @@ def redraw_all(app, canvas) -> None:
         else:
             pass
 
+    trail_cache_of(canvas).forget_unused()
+
     # Simulation info
     draw_time_passed(app, canvas)
     draw_sim_info(app,canvas)
 
     # Controls info
-    canvas.create_text(app.width/2, app.height - 48, 
-                       text=('<Space> to pause | <+> and <-> to change simrate | <MouseWheel> to zoom\n'
-                             '<LeftMouseButton> to move view | <RightMouseButton> to place down a Sun'), 
-                       font=('Courier', 12), 
-                       fill='white', justify='center')
+    if app.replay is not None:
+        draw_timeline(app, canvas)
+        controls = ('<Space> to pause | <+> and <-> to change replay speed | <MouseWheel> to zoom\n'
+                    '<LeftMouseButton> to move view | Drag the timeline to jump in time\n'
+                    '<Left> and <Right> to skip back and forward')
+    else:
+        controls = ('<Space> to pause | <+> and <-> to change simrate | <MouseWheel> to zoom\n'
+                    '<LeftMouseButton> to move view | <RightMouseButton> to place down a Sun\n'
+                    '<B> to toggle Barnes-Hut gravity | <S> to save and <L> to load a checkpoint')
+    draw_item(app, canvas, 'hud', 'controls', 'text', (app.width/2, app.height - 56),
+              text=controls,
+              font=('Courier', 12),
+              fill='white', justify='center')
 
     # Draw PAUSED
     if app.sim_paused:
-        canvas.create_text(app.width/2, app.height-app.height/8, 
-                    text="PAUSED", 
-                    font=('Helvetica', 42, 'bold'), 
-                    fill='white', justify='center')
+        draw_item(app, canvas, 'hud', 'paused', 'text', (app.width/2, app.height-app.height/8),
+                  text="PAUSED",
+                  font=('Helvetica', 42, 'bold'),
+                  fill='white', justify='center')
+
+    items = canvas_items_of(app, canvas)
+    if items is not None:
+        items.finish(canvas, {trail_key(body) for body in bodies})
@@ -0,0 +1,188 @@
+# Standard imports
+from math import ceil
+
+# Third party imports
+import numpy as np
+
+# Local imports
+from body import G, PI, Body
+from integrators import YOSHIDA_DRIFTS, YOSHIDA_KICKS
+
+
+class Ensemble:
+    """Many copies (replicas) of a small system, stepped together
+
+    Every array has a leading batch axis: pos[b, i] is the position of
+    body i in replica b. One force evaluation computes the pulls between
+    all pairs of bodies in all replicas in one go, so for systems like
+    init_bodies() the Python overhead is paid once per step instead of
+    once per replica.
+
+    Collided bodies are merged like in collision.py, but the arrays keep
+    their shape: the eaten body is only marked as not alive, and has no
+    mass or radius from then on.
+    """
+    __slots__ = ("names", "pos", "speed", "accel", "mass", "density", "radius", "static", "alive")
+
+    # How many replicas to put in one (replicas, n, n) block of the pair
+    # matrices. Keeps memory use at BATCH_BLOCK*n*n per array.
+    BATCH_BLOCK = 4096
+
+    def __init__(self, names: list[str], pos: np.ndarray, speed: np.ndarray, mass: np.ndarray,
+                 density: np.ndarray, static: np.ndarray) -> None:
+        self.names = tuple(names)
+        self.pos = np.array(pos, dtype=float)
+        self.speed = np.array(speed, dtype=float)
+        self.mass = np.array(mass, dtype=float)
+        self.density = np.array(density, dtype=float)
+        self.static = np.array(static, dtype=bool)
+        self.alive = np.ones(self.mass.shape, dtype=bool)
+        self.radius = body_radius(self.mass, self.density)
+        self.accel = np.zeros_like(self.pos)
+        self.update_accelerations()
+
+    @classmethod
+    def from_bodies(cls, bodies: list[Body], copies: int, mass_jitter: float = 0,
+                    seed: int = None) -> "Ensemble":
+        """Returns copies replicas of bodies
+
+        With mass_jitter, every mass in every replica is scaled by
+        a random factor in [1 - mass_jitter, 1 + mass_jitter].
+        """
+        bodies = list(bodies)
+        pos = np.array([body.pos for body in bodies], dtype=float)
+        speed = np.array([body.speed for body in bodies], dtype=float)
+        mass = np.array([body.mass for body in bodies], dtype=float)
+
+        mass = np.repeat(mass[np.newaxis, :], copies, axis=0)
+        if mass_jitter:
+            rng = np.random.default_rng(seed)
+            mass *= rng.uniform(1 - mass_jitter, 1 + mass_jitter, mass.shape)
+
+        return cls(names=[body.name for body in bodies],
+                   pos=np.repeat(pos[np.newaxis], copies, axis=0),
+                   speed=np.repeat(speed[np.newaxis], copies, axis=0),
+                   mass=mass,
+                   density=np.repeat([[body.density for body in bodies]], copies, axis=0),
+                   static=np.repeat([[body.static for body in bodies]], copies, axis=0))
+
+    def __len__(self) -> int:
+        return len(self.mass)
+
+    def update_accelerations(self) -> None:
+        """Sets the acceleration of every body in every replica, a_i = G * sum_j(m_j * delta_ij / |delta_ij|³)"""
+        for start in range(0, len(self), self.BATCH_BLOCK):
+            batch = slice(start, start + self.BATCH_BLOCK)
+            delta_x, delta_y, dist = pair_vectors(self.pos[batch])
+            radius = self.radius[batch]
+
+            # Collided bodies (and every body with itself) don't pull on each other
+            apart = (dist > radius[:, :, np.newaxis]) & (dist > radius[:, np.newaxis, :])
+            weight = np.divide(G * self.mass[batch][:, np.newaxis, :], dist*dist*dist,
+                               out=np.zeros_like(dist), where=apart)
+            self.accel[batch, :, 0] = (weight*delta_x).sum(axis=2)
+            self.accel[batch, :, 1] = (weight*delta_y).sum(axis=2)
+
+    def drift(self, time: int | float) -> None:
+        moving = (~self.static)[..., np.newaxis]
+        self.pos += np.where(moving, self.speed * time, 0)  # s = v*t
+
+    def kick(self, time: int | float) -> None:
+        self.speed += self.accel * time  # v = v_0 + a*t
+
+    def step(self, time: int | float, integrator: str = "yoshida") -> None:
+        """Moves every replica time seconds forward, same schemes as in integrators.py"""
+        if integrator == "euler":
+            self.drift(time)
+            self.update_accelerations()
+            self.kick(time)
+        elif integrator in ("leapfrog", "verlet"):
+            self.kick(time/2)
+            self.drift(time)
+            self.update_accelerations()
+            self.kick(time/2)
+        elif integrator == "yoshida":
+            for drift, kick in zip(YOSHIDA_DRIFTS, YOSHIDA_KICKS):
+                self.drift(drift*time)
+                self.update_accelerations()
+                self.kick(kick*time)
+            self.drift(YOSHIDA_DRIFTS[-1]*time)
+        else:
+            raise ValueError(f"The ensemble engine can't use the {integrator!r} integrator")
+        self.merge_collided()
+
+    def simulate(self, time: int | float, max_time: int | float, integrator: str = "yoshida") -> int:
+        """Same splitting into steps as simulate_bodies(). Returns the number of steps."""
+        repeat = ceil(time/max_time) if time > max_time else 1
+        for _ in range(repeat):
+            self.step(time/repeat, integrator)
+        return repeat
+
+    def merge_collided(self) -> None:
+        """Merges the bodies that have collided, in every replica
+
+        Finding the collisions is vectorized, BATCH_BLOCK replicas at a
+        time like update_accelerations(). The merges themselves are rare,
+        so they are done one at a time, with the heavier body eating the
+        lighter one and keeping the total momentum (see merge_into()).
+        """
+        collided = []
+        for start in range(0, len(self), self.BATCH_BLOCK):
+            batch = slice(start, start + self.BATCH_BLOCK)
+            _, _, dist = pair_vectors(self.pos[batch])
+            radius = self.radius[batch]
+            alive = self.alive[batch]
+            touching = (dist <= radius[:, :, np.newaxis]) | (dist <= radius[:, np.newaxis, :])
+            touching &= alive[:, :, np.newaxis] & alive[:, np.newaxis, :]
+            touching = np.triu(touching, k=1)  # Every pair once, and not with itself
+            if touching.any():
+                replicas, i, j = np.nonzero(touching)
+                collided.extend(zip((replicas + start).tolist(), i.tolist(), j.tolist()))
+        if not collided:
+            return
+
+        for replica, i, j in collided:
+            if not (self.alive[replica, i] and self.alive[replica, j]):
+                continue  # Already eaten by another merge this step
+            if self.mass[replica, j] > self.mass[replica, i]:
+                i, j = j, i
+            mass_i = self.mass[replica, i]
+            mass_j = self.mass[replica, j]
+            new_mass = mass_i + mass_j
+            self.speed[replica, i] = (mass_i * self.speed[replica, i]
+                                      + mass_j * self.speed[replica, j]) / new_mass
+            self.mass[replica, i] = new_mass
+            self.radius[replica, i] = body_radius(new_mass, self.density[replica, i])
+
+            self.alive[replica, j] = False
+            self.mass[replica, j] = 0
+            self.radius[replica, j] = 0
+            self.speed[replica, j] = 0
+            self.static[replica, j] = True
+
+        self.update_accelerations()
+
+    def total_energy(self) -> np.ndarray:
+        """Returns the kinetic plus potential energy of every replica (see body.total_energy())"""
+        kinetic = (self.mass * (self.speed*self.speed).sum(axis=-1) / 2).sum(axis=1)
+        _, _, dist = pair_vectors(self.pos)
+        pairs = np.triu(np.ones(dist.shape[1:], dtype=bool), k=1) & (dist > 0)
+        potential = np.divide(G * self.mass[:, :, np.newaxis] * self.mass[:, np.newaxis, :], dist,
+                              out=np.zeros_like(dist), where=pairs)
+        return kinetic - potential.sum(axis=(1, 2))
+
+def pair_vectors(pos: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Returns (delta_x, delta_y, dist) between all pairs of bodies in every replica
+
+    (delta_x[b, i, j], delta_y[b, i, j]) is the vector from body i
+    towards body j in replica b, and dist[b, i, j] is its length.
+    """
+    pos_x = pos[..., 0]
+    pos_y = pos[..., 1]
+    delta_x = pos_x[:, np.newaxis, :] - pos_x[:, :, np.newaxis]
+    delta_y = pos_y[:, np.newaxis, :] - pos_y[:, :, np.newaxis]
+    return delta_x, delta_y, np.sqrt(delta_x*delta_x + delta_y*delta_y)
+
+def body_radius(mass, density):
+    """Returns the radius of a sphere with mass and density, rounded like Body.radius"""
+    return np.round(((mass/density)*(3/(4*PI)))**(1/3))
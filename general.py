@@ -29,3 +29,23 @@ def sec_to_practical_time_string(sec: int) -> str:
         return f'{int(sec/(60*60*24))}d'
     else:
         return f'{int(sec/(60*60*24*365))}y'
+
+def practical_time_string_to_sec(text: str) -> float:
+    """Returns the seconds in a time string, the opposite of sec_to_practical_time_string()
+
+    '30' -> 30.  '30s' -> 30.  '1h' -> 3600.  '1.5d' -> 129600.  '2y' -> 63072000.
+    """
+    units = {'s': 1, 'm': 60, 'h': 60*60, 'd': 60*60*24, 'y': 60*60*24*365}
+    text = text.strip()
+    if text and text[-1] in units:
+        return float(text[:-1]) * units[text[-1]]
+    return float(text)
+
+def model_changed(app) -> None:
+    """Counts a change of the app state (the model), for the cheap MVC check
+
+    With mvc_check='version' (see main.py), redraw_all() is only checked
+    for changing app.model_version, instead of hashing the whole app.
+    Everything that changes the model (the timer and the controls) calls this.
+    """
+    app.model_version += 1
@@ -0,0 +1,77 @@
+# Standard imports
+from math import cos, cosh, sin, sinh, sqrt
+
+
+def stumpff_c(z: float) -> float:
+    """Stumpff function C(z) = (1 - cos(√z))/z"""
+    if z > 1e-4:
+        return (1 - cos(sqrt(z))) / z
+    elif z < -1e-4:
+        return (cosh(sqrt(-z)) - 1) / (-z)
+    else:
+        # Series, the closed forms lose precision close to z = 0
+        return 1/2 - z/24 + z*z/720 - z*z*z/40320
+
+def stumpff_s(z: float) -> float:
+    """Stumpff function S(z) = (√z - sin(√z))/√z³"""
+    if z > 1e-4:
+        root = sqrt(z)
+        return (root - sin(root)) / (root*root*root)
+    elif z < -1e-4:
+        root = sqrt(-z)
+        return (sinh(root) - root) / (root*root*root)
+    else:
+        return 1/6 - z/120 + z*z/5040 - z*z*z/362880
+
+def kepler_drift(pos: tuple[float, float], speed: tuple[float, float],
+                 mu: float, time: float) -> tuple[tuple[float, float], tuple[float, float]]:
+    """Returns (pos, speed) after moving along a Kepler orbit for the given time
+
+    pos and speed are relative to the central body, and mu is G times
+    its mass. Solves Kepler's equation in universal variables, so it
+    works for circular, elliptic and hyperbolic orbits alike.
+
+    More info: Curtis, Orbital Mechanics for Engineering Students, ch. 3.7
+    """
+    pos_x, pos_y = pos
+    speed_x, speed_y = speed
+    sqrt_mu = sqrt(mu)
+
+    r_0 = sqrt(pos_x*pos_x + pos_y*pos_y)
+    radial_speed = (pos_x*speed_x + pos_y*speed_y) / r_0
+    alpha = 2/r_0 - (speed_x*speed_x + speed_y*speed_y)/mu  # 1/semi-major axis
+
+    # Solve for the universal anomaly chi with Newton's method
+    chi = sqrt_mu * abs(alpha) * time if alpha > 0 else sqrt_mu * time / r_0
+    for _ in range(50):
+        z = alpha*chi*chi
+        c = stumpff_c(z)
+        s = stumpff_s(z)
+        chi_sq = chi*chi
+        value = (r_0*radial_speed/sqrt_mu * chi_sq * c
+                 + (1 - alpha*r_0) * chi_sq*chi * s
+                 + r_0*chi - sqrt_mu*time)
+        slope = (r_0*radial_speed/sqrt_mu * chi * (1 - z*s)
+                 + (1 - alpha*r_0) * chi_sq * c
+                 + r_0)
+        correction = value/slope
+        chi -= correction
+        if abs(correction) <= 1e-12 * (abs(chi) + 1e-12):
+            break
+
+    # Lagrange coefficients
+    z = alpha*chi*chi
+    c = stumpff_c(z)
+    s = stumpff_s(z)
+    f = 1 - chi*chi/r_0 * c
+    g = time - chi*chi*chi/sqrt_mu * s
+
+    new_x = f*pos_x + g*speed_x
+    new_y = f*pos_y + g*speed_y
+    r = sqrt(new_x*new_x + new_y*new_y)
+
+    f_dot = sqrt_mu/(r*r_0) * (alpha*chi*chi*chi*s - chi)
+    g_dot = 1 - chi*chi/r * c
+
+    return ((new_x, new_y),
+            (f_dot*pos_x + g_dot*speed_x, f_dot*pos_y + g_dot*speed_y))
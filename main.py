@@ -1,3 +1,6 @@
+# Standard imports
+from argparse import ArgumentParser
+
 # Local imports
 from uib_inf100_graphics import *
 from simulation import *
@@ -5,6 +8,7 @@ from control import *
 from draw import *
 from body import *
 from view import *
+from general import practical_time_string_to_sec
 
 
 def app_started(app) -> None:
@@ -12,10 +16,54 @@ def app_started(app) -> None:
     init_bodies(app)
     init_view(app)
     init_control(app)
-    init_simulation(app)
+    init_simulation(app, **START_OPTIONS)
+
+def app_stopped(app) -> None:
+    """Called one time when the app is closed"""
+    stop_simulation(app)
+
+# Options from the command line, passed on to init_simulation()
+START_OPTIONS = {}
+
+# --mvc-check choices, as the mvc_check option of run_app()
+MVC_CHECKS = {"deep": True, "version": "version", "off": False}
 
 if __name__ == "__main__":
-    run_app(width=900, height=900, title="Solar System Sim")
+    parser = ArgumentParser(description="Solar System Sim")
+    parser.add_argument("--integrator", choices=INTEGRATORS, default="yoshida",
+                        help="how the bodies are moved forward in time (default: yoshida)")
+    parser.add_argument("--tolerance", type=float, default=RK45_TOLERANCE,
+                        help=f"error tolerance for adaptive integrators (default: {RK45_TOLERANCE})")
+    parser.add_argument("--belt", type=int, default=0,
+                        help="number of massless particles in the asteroid belt (default: 0)")
+    # The worker processes always compute every pull, so the two don't mix
+    force_engine = parser.add_mutually_exclusive_group()
+    force_engine.add_argument("--far-cache", action="store_true",
+                              help="only refresh the weak far-field pulls every few steps (needs NumPy)")
+    force_engine.add_argument("--workers", type=int, default=0,
+                              help="split the gravity between this many processes, at least 2 (needs NumPy)")
+    parser.add_argument("--background", action="store_true",
+                        help="step the simulation in a background thread, so slow steps don't freeze the window")
+    parser.add_argument("--restore", default=None,
+                        help="continue from a checkpoint .npz, saved with <S> or solarsim run --out (needs NumPy)")
+    parser.add_argument("--record", default=None,
+                        help="record the positions and speeds into this ring buffer file (needs NumPy)")
+    parser.add_argument("--record-every", type=practical_time_string_to_sec, default=60*60*24,
+                        help="simulated time between recorded frames (default: 1d)")
+    parser.add_argument("--replay", default=None,
+                        help="play back a file recorded with --record instead of simulating (needs NumPy)")
+    parser.add_argument("--immediate-drawing", action="store_true",
+                        help="clear the canvas and make every item again each frame, instead of moving them")
+    parser.add_argument("--mvc-check", choices=MVC_CHECKS, default="version",
+                        help="how redraw_all is checked for changing the model: deep hashes the whole app "
+                             "every frame (slow, for debugging), version only looks at app.model_version "
+                             "(default: version)")
+    START_OPTIONS.update(vars(parser.parse_args()))
+    immediate_drawing = START_OPTIONS.pop("immediate_drawing")
+    mvc_check = MVC_CHECKS[START_OPTIONS.pop("mvc_check")]
+
+    run_app(width=900, height=900, title="Solar System Sim",
+            retained_drawing=not immediate_drawing, mvc_check=mvc_check)
 
 
 # UNCOMMENT TO DEBUG PERFOMANCE https://stackoverflow.com/a/6880574
@@ -0,0 +1,140 @@
+# Standard imports
+from math import sqrt
+
+# Local imports
+from body import G, Body
+
+
+def set_pairwise_forces(bodies: list[Body]) -> list[tuple[Body, Body]]:
+    """Sets the force on every body and returns all pairs of collided bodies
+
+    Pure Python alternative to calling Body.force_from() for every body.
+    Every unordered pair of bodies is visited once, the vector and
+    distance between them is computed once, and the force is added to
+    one body and subtracted from the other (Newton's third law). The
+    direction comes straight from the vector between the bodies, so no
+    atan2/cos/sin, and nothing is rounded.
+
+    Collided bodies don't pull on each other (same as Body.force_from()),
+    and since the distance is known anyway, they are returned as pairs.
+    """
+    # Copy the values into plain lists once, instead of
+    # going through the Body attributes for every pair
+    pos_x = []
+    pos_y = []
+    mass = []
+    radius = []
+    for body in bodies:
+        x, y = body.pos
+        pos_x.append(x)
+        pos_y.append(y)
+        mass.append(body.mass)
+        radius.append(body.radius)
+
+    n = len(mass)
+    force_x = [0.0] * n
+    force_y = [0.0] * n
+    colliding = []
+
+    for i in range(n):
+        x_i = pos_x[i]
+        y_i = pos_y[i]
+        gm_i = G * mass[i]
+        radius_i = radius[i]
+        sum_x = 0.0
+        sum_y = 0.0
+
+        for j in range(i + 1, n):
+            delta_x = pos_x[j] - x_i
+            delta_y = pos_y[j] - y_i
+            dist_sq = delta_x*delta_x + delta_y*delta_y
+
+            # Collision if the distance is within the radius of either body
+            max_radius = radius_i if radius_i > radius[j] else radius[j]
+            if dist_sq <= max_radius*max_radius:
+                colliding.append((bodies[i], bodies[j]))
+                continue
+
+            # F = G*m_i*m_j/r², along delta/r
+            scale = gm_i * mass[j] / (dist_sq * sqrt(dist_sq))
+            pair_x = scale * delta_x
+            pair_y = scale * delta_y
+            sum_x += pair_x
+            sum_y += pair_y
+            force_x[j] -= pair_x
+            force_y[j] -= pair_y
+
+        force_x[i] += sum_x
+        force_y[i] += sum_y
+
+    for body, body_force_x, body_force_y in zip(bodies, force_x, force_y):
+        body.force = (body_force_x, body_force_y)
+
+    return colliding
+
+def set_forces_on(bodies: list[Body], active: list[int]) -> None:
+    """Sets the force on only the active bodies (indices), from all bodies
+
+    Used when only some bodies need new forces (see integrators.step_block()).
+    Every active body is paired with every other body, so Newton's third
+    law can't be used here.
+    """
+    pos_x = []
+    pos_y = []
+    mass = []
+    radius = []
+    for body in bodies:
+        x, y = body.pos
+        pos_x.append(x)
+        pos_y.append(y)
+        mass.append(body.mass)
+        radius.append(body.radius)
+
+    for i in active:
+        x_i = pos_x[i]
+        y_i = pos_y[i]
+        radius_i = radius[i]
+        sum_x = 0.0
+        sum_y = 0.0
+
+        for j in range(len(mass)):
+            delta_x = pos_x[j] - x_i
+            delta_y = pos_y[j] - y_i
+            dist_sq = delta_x*delta_x + delta_y*delta_y
+
+            # Also skips the body itself (dist_sq = 0)
+            max_radius = radius_i if radius_i > radius[j] else radius[j]
+            if dist_sq <= max_radius*max_radius:
+                continue
+
+            scale = mass[j] / (dist_sq * sqrt(dist_sq))
+            sum_x += scale * delta_x
+            sum_y += scale * delta_y
+
+        gm_i = G * mass[i]
+        bodies[i].force = (gm_i * sum_x, gm_i * sum_y)
+
+def encounter_timescales(bodies: list[Body]) -> list[float]:
+    """Returns the shortest sqrt(r³/(G*(m_i + m_j))) from every body to any other body
+
+    Pure Python version of BodyStore.encounter_timescales().
+    """
+    pos = [body.pos for body in bodies]
+    mass = [body.mass for body in bodies]
+    n = len(mass)
+    timescales = [float('inf')] * n
+
+    for i in range(n):
+        x_i, y_i = pos[i]
+        for j in range(i + 1, n):
+            x_j, y_j = pos[j]
+            dist_sq = (x_j - x_i)**2 + (y_j - y_i)**2
+            if dist_sq == 0:
+                continue
+            timescale = sqrt(dist_sq * sqrt(dist_sq) / (G * (mass[i] + mass[j])))
+            if timescale < timescales[i]:
+                timescales[i] = timescale
+            if timescale < timescales[j]:
+                timescales[j] = timescale
+
+    return timescales
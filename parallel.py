@@ -0,0 +1,106 @@
+# Standard imports
+from math import ceil
+from multiprocessing import Pool, shared_memory
+from os import cpu_count
+
+# Third party imports
+import numpy as np
+
+# Local imports
+from body_store import BodyStore, set_forces_on_rows
+
+# Shared memory blocks a worker process has attached to, by name
+_attached = {}
+
+
+class ParallelForces:
+    """Computes the forces of a BodyStore on several cores
+
+    The positions, masses and radii are copied into one block of shared
+    memory, and the rows of the all-pairs force computation are split
+    between a pool of worker processes that is started once and kept.
+    Every worker writes the forces of its rows straight into the shared
+    force array, so only the block name and row ranges are sent to the
+    workers, and no Body objects or arrays are pickled.
+
+    Only pays off with a few thousand bodies or more. Below that, sending
+    the tasks to the workers costs more than the forces themselves.
+    """
+    __slots__ = ("workers", "pool", "capacity", "memory", "pos", "mass", "radius", "force")
+
+    def __init__(self, workers: int = None, capacity: int = 1024) -> None:
+        self.workers = workers or cpu_count() or 1
+        self.capacity = 0
+        self.memory = None
+        # Before the pool, so the workers share the resource tracker
+        # that the first block starts, which then only sees each block once
+        self._allocate(capacity)
+        self.pool = Pool(self.workers)
+
+    def _allocate(self, capacity: int) -> None:
+        """Replaces the shared memory block with one that fits capacity bodies"""
+        self._free_memory()
+        # pos (x, y), mass, radius and force (x, y) for every body
+        self.memory = shared_memory.SharedMemory(create=True, size=capacity * 6 * 8)
+        self.capacity = capacity
+        self.pos, self.mass, self.radius, self.force = shared_arrays(self.memory, capacity)
+
+    def _free_memory(self) -> None:
+        if self.memory is not None:
+            # The arrays have to go before the block can be closed
+            self.pos = self.mass = self.radius = self.force = None
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
+
+    def compute_forces(self, store: BodyStore, rows=None) -> None:
+        """Same as BodyStore.compute_forces(), split between the worker processes"""
+        n = store.count
+        if n > self.capacity:
+            self._allocate(max(2 * self.capacity, n))
+        if rows is None:
+            rows = np.arange(n)
+        rows = np.asarray(rows, dtype=int)
+
+        self.pos[:n] = store.pos[:n]
+        self.mass[:n] = store.mass[:n]
+        self.radius[:n] = store.radius[:n]
+
+        chunk = ceil(len(rows) / self.workers)
+        tasks = [(self.memory.name, self.capacity, n, rows[start:start + chunk])
+                 for start in range(0, len(rows), chunk)]
+        self.pool.starmap(_worker_forces, tasks)
+
+        store.force[rows] = self.force[rows]
+
+    def close(self) -> None:
+        """Stops the worker processes and frees the shared memory"""
+        self.pool.close()
+        self.pool.join()
+        self._free_memory()
+
+def shared_arrays(memory: shared_memory.SharedMemory, capacity: int) -> tuple[np.ndarray, ...]:
+    """Returns the pos, mass, radius and force arrays laid out in memory"""
+    values = np.ndarray((6, capacity), dtype=float, buffer=memory.buf)
+    pos = values[0:2].T
+    force = values[4:6].T
+    return pos, values[2], values[3], force
+
+def _worker_forces(name: str, capacity: int, count: int, rows: np.ndarray) -> None:
+    """Runs in a worker process: sets the forces on rows in the shared block name"""
+    if name not in _attached:
+        # A new block means the old one is gone (see ParallelForces._allocate())
+        while _attached:
+            _, (memory, arrays) = _attached.popitem()
+            del arrays  # The arrays have to go before the block can be closed
+            memory.close()
+
+        # The main process owns the block and unlinks it
+        try:
+            memory = shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+        except TypeError:
+            memory = shared_memory.SharedMemory(name=name)
+        _attached[name] = (memory, shared_arrays(memory, capacity))
+
+    pos, mass, radius, force = _attached[name][1]
+    set_forces_on_rows(pos[:count], mass[:count], radius[:count], rows, force)
@@ -0,0 +1,83 @@
+# Third party imports
+import numpy as np
+
+# Local imports
+from body import G, Body
+
+# Inner and outer edge of the main asteroid belt (m), between Mars and Jupiter
+MAIN_BELT = (2.2 * 149.6*10**9, 3.2 * 149.6*10**9)
+
+
+class Particles:
+    """Massless test particles, like asteroid belts and debris fields
+
+    Particles are pulled by the bodies, but don't pull on anything
+    themselves, so the cost is O(bodies × particles) instead of O(n²)
+    for the same amount of Body objects. They are kept in NumPy arrays
+    only, there is no object per particle.
+
+    A particle that ends up inside a body is absorbed (removed). Its
+    mass is zero, so the body doesn't change.
+    """
+    __slots__ = ("pos", "speed", "accel")
+
+    def __init__(self, pos: np.ndarray, speed: np.ndarray) -> None:
+        self.pos = np.asarray(pos, dtype=float).reshape(-1, 2)
+        self.speed = np.asarray(speed, dtype=float).reshape(-1, 2)
+        self.accel = np.zeros_like(self.pos)
+
+    def __len__(self) -> int:
+        return len(self.pos)
+
+    def drift(self, time: int | float) -> None:
+        self.pos += self.speed * time  # s = v*t
+
+    def kick(self, time: int | float) -> None:
+        self.speed += self.accel * time  # v = v_0 + a*t
+
+    def update_accelerations(self, bodies) -> None:
+        """Sets the acceleration of every particle from all bodies, and removes absorbed particles"""
+        accel = np.zeros_like(self.pos)
+        absorbed = np.zeros(len(self), dtype=bool)
+
+        for body in bodies:
+            body_x, body_y = body.pos
+            delta_x = body_x - self.pos[:, 0]
+            delta_y = body_y - self.pos[:, 1]
+            dist_sq = delta_x*delta_x + delta_y*delta_y
+
+            inside = dist_sq <= body.radius*body.radius
+            absorbed |= inside
+
+            # a = G*m/r², along delta/r
+            scale = np.divide(G * body.mass, dist_sq * np.sqrt(dist_sq),
+                              out=np.zeros_like(dist_sq), where=~inside)
+            accel[:, 0] += scale * delta_x
+            accel[:, 1] += scale * delta_y
+
+        self.accel = accel
+        if absorbed.any():
+            self.pos = self.pos[~absorbed]
+            self.speed = self.speed[~absorbed]
+            self.accel = self.accel[~absorbed]
+
+def create_particles(amount: int, central: Body, dist_min: float = MAIN_BELT[0],
+                     dist_max: float = MAIN_BELT[1], seed: int = None) -> Particles:
+    """Returns particles spread in a ring around central, on circular orbits
+
+    With the default distances this is the main asteroid belt around the Sun.
+    """
+    rng = np.random.default_rng(seed)
+    # Uniform over the area of the ring, not over the radius
+    dist = np.sqrt(rng.uniform(dist_min**2, dist_max**2, amount))
+    angle = rng.uniform(0, 2*np.pi, amount)
+
+    center_x, center_y = central.pos
+    center_speed_x, center_speed_y = central.speed
+    orbital_speed = np.sqrt(G * central.mass / dist)  # v = √(GM/r) for circular orbits
+
+    pos = np.column_stack((center_x + dist*np.cos(angle),
+                           center_y + dist*np.sin(angle)))
+    speed = np.column_stack((center_speed_x - orbital_speed*np.sin(angle),
+                             center_speed_y + orbital_speed*np.cos(angle)))
+    return Particles(pos, speed)
@@ -0,0 +1,155 @@
+# Standard imports
+from math import sqrt
+
+# Local imports
+from body import G, Body
+
+
+class QuadNode:
+    """A square cell of the quadtree, with the total mass and center of mass of everything in it"""
+    __slots__ = ("size", "mass", "com_x", "com_y", "indices", "children")
+
+    def __init__(self, size: float) -> None:
+        self.size = size      # Width of the cell (m)
+        self.mass = 0.0
+        self.com_x = 0.0
+        self.com_y = 0.0
+        self.indices = None   # Body indices, only set for leaf cells
+        self.children = None  # Sub cells, only set for inner cells
+
+class QuadTree:
+    """Barnes–Hut quadtree over a list of bodies
+
+    The tree is built from the current positions of the bodies, so it has
+    to be rebuilt every time they move. Far away groups of bodies are
+    treated as one body at their center of mass, which makes the force on
+    all bodies O(n log n) instead of O(n²).
+
+    More info: https://en.wikipedia.org/wiki/Barnes%E2%80%93Hut_simulation
+    """
+    # Cells deeper than this are not split any further. Only happens
+    # when bodies are (almost) on top of each other.
+    MAX_DEPTH = 40
+
+    def __init__(self, bodies: list[Body]) -> None:
+        self.pos_x = []
+        self.pos_y = []
+        self.mass = []
+        self.radius = []
+        for body in bodies:
+            pos_x, pos_y = body.pos
+            self.pos_x.append(pos_x)
+            self.pos_y.append(pos_y)
+            self.mass.append(body.mass)
+            self.radius.append(body.radius)
+
+        if len(self.mass) == 0:
+            self.root = QuadNode(0)
+            self.root.indices = []
+            return
+
+        # Smallest square containing all bodies
+        min_x, max_x = min(self.pos_x), max(self.pos_x)
+        min_y, max_y = min(self.pos_y), max(self.pos_y)
+        size = max(max_x - min_x, max_y - min_y, 1)
+        center_x = (min_x + max_x)/2
+        center_y = (min_y + max_y)/2
+
+        self.root = self._build(list(range(len(self.mass))), center_x, center_y, size, 0)
+
+    def _build(self, indices: list[int], center_x: float, center_y: float,
+               size: float, depth: int) -> QuadNode:
+        node = QuadNode(size)
+
+        if len(indices) == 1 or depth == self.MAX_DEPTH:
+            node.indices = indices
+            for i in indices:
+                node.mass += self.mass[i]
+                node.com_x += self.mass[i] * self.pos_x[i]
+                node.com_y += self.mass[i] * self.pos_y[i]
+        else:
+            # Split the indices into the four quadrants
+            quadrants = ([], [], [], [])
+            for i in indices:
+                quadrant = (self.pos_x[i] >= center_x) + 2*(self.pos_y[i] >= center_y)
+                quadrants[quadrant].append(i)
+
+            node.children = []
+            offset = size/4
+            for quadrant, quadrant_indices in enumerate(quadrants):
+                if not quadrant_indices:
+                    continue
+                child_x = center_x + (offset if quadrant & 1 else -offset)
+                child_y = center_y + (offset if quadrant & 2 else -offset)
+                child = self._build(quadrant_indices, child_x, child_y, size/2, depth + 1)
+                node.children.append(child)
+
+                node.mass += child.mass
+                node.com_x += child.mass * child.com_x
+                node.com_y += child.mass * child.com_y
+
+        if node.mass > 0:
+            node.com_x /= node.mass
+            node.com_y /= node.mass
+        return node
+
+    def force_on(self, index: int, theta: float) -> tuple[float, float]:
+        """Returns the force on the body with the given index from all the other bodies
+
+        theta is the opening angle. A cell is treated as one body when
+        cell size / distance < theta. theta=0 gives the exact direct sum,
+        larger values are faster but less accurate (0.5 is common).
+        """
+        pos_x = self.pos_x[index]
+        pos_y = self.pos_y[index]
+        radius = self.radius[index]
+        theta_sq = theta * theta
+
+        accel_x = 0.0
+        accel_y = 0.0
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+
+            if node.children is None:
+                # Leaf, so use the exact bodies in it
+                for j in node.indices:
+                    if j == index:
+                        continue
+                    delta_x = self.pos_x[j] - pos_x
+                    delta_y = self.pos_y[j] - pos_y
+                    distance = sqrt(delta_x*delta_x + delta_y*delta_y)
+
+                    # Collided bodies don't pull on each other (see Body.force_from())
+                    if distance <= radius or distance <= self.radius[j]:
+                        continue
+                    weight = self.mass[j] / (distance*distance*distance)
+                    accel_x += weight * delta_x
+                    accel_y += weight * delta_y
+                continue
+
+            delta_x = node.com_x - pos_x
+            delta_y = node.com_y - pos_y
+            distance_sq = delta_x*delta_x + delta_y*delta_y
+
+            if node.size*node.size < theta_sq * distance_sq:
+                # Far enough away to be treated as one body
+                weight = node.mass / (distance_sq * sqrt(distance_sq))
+                accel_x += weight * delta_x
+                accel_y += weight * delta_y
+            else:
+                stack.extend(node.children)
+
+        mass = self.mass[index]
+        return (G * mass * accel_x, G * mass * accel_y)
+
+def set_barnes_hut_forces(bodies: list[Body], theta: float, active: list[int] = None) -> None:
+    """Builds a new quadtree over bodies and sets the force on every body from it
+
+    If active (body indices) is given, only the force on those bodies is set.
+    """
+    tree = QuadTree(bodies)
+    if active is None:
+        active = range(len(bodies))
+    for index in active:
+        bodies[index].force = tree.force_on(index, theta)
@@ -0,0 +1,179 @@
+# Standard imports
+import json
+from warnings import warn
+
+# Third party imports
+import numpy as np
+
+# Local imports
+from integrators import is_body_store
+
+RECORDING_MAGIC = b"SSSTRAJ2"
+
+# Added to the path of a recording for the file with the body names
+NAMES_SUFFIX = ".names.jsonl"
+
+# First record of the file
+HEADER = np.dtype([("magic", "S8"),
+                   ("capacity", "<i8"),        # Number of frame slots in the ring
+                   ("max_bodies", "<i8"),      # Bodies per frame, the rest are not recorded
+                   ("cadence", "<f8"),         # Simulated seconds between frames
+                   ("frames_written", "<i8")]) # Frames written since the start
+
+
+def frame_dtype(max_bodies: int) -> np.dtype:
+    """The layout of one frame slot, right after the header and each other"""
+    return np.dtype([("seq", "<i8"),    # Frame number, -1 while the slot is being written
+                     ("time", "<f8"),   # sim_sec_passed of the frame
+                     ("count", "<i8"),  # Number of bodies at the time, can be > max_bodies
+                     ("ids", "<i8", (max_bodies,)),
+                     ("pos", "<f8", (max_bodies, 2)),
+                     ("speed", "<f8", (max_bodies, 2)),
+                     ("radius", "<f8", (max_bodies,))])
+
+class TrajectoryRecorder:
+    """Records the position, speed and radius of every body into a ring buffer file
+
+    The file is memory mapped, so a frame is written with a few array
+    copies into the page cache, and the operating system writes it to
+    disk in its own time. The step loop never waits for the disk. Once
+    the ring is full, the oldest frames are overwritten.
+
+    Every body gets a fixed id (its index in names) the first time it is
+    recorded, so it can be followed through merges and new Suns. Its
+    name is added to a file next to the recording (path + ".names.jsonl",
+    one JSON string per line) before the first frame with it is done.
+
+    Other processes can read the file while it is written, zero-copy,
+    with TrajectoryReader.
+    """
+    __slots__ = ("path", "header", "frames", "cadence", "time", "next_time", "ids", "names", "known",
+                 "names_file", "warned")
+
+    def __init__(self, path: str, cadence: float, max_bodies: int,
+                 capacity: int = 10000, start_time: float = 0) -> None:
+        self.path = path
+        self.cadence = cadence
+        self.time = start_time
+        self.next_time = start_time
+        self.ids = {}     # id(body) -> recorder id
+        self.names = []   # recorder id -> body name
+        self.known = []   # Keeps the recorded bodies alive, so their id() is never reused
+        self.names_file = open(path + NAMES_SUFFIX, "w", encoding="utf-8")
+        self.warned = False  # If too many bodies have been warned about
+
+        size = HEADER.itemsize + capacity * frame_dtype(max_bodies).itemsize
+        with open(path, "wb") as file:
+            file.truncate(size)
+        self.header = np.memmap(path, dtype=HEADER, mode="r+", shape=(1,))
+        self.frames = np.memmap(path, dtype=frame_dtype(max_bodies), mode="r+",
+                                offset=HEADER.itemsize, shape=(capacity,))
+        self.frames["seq"] = -1
+        self.header[0] = (RECORDING_MAGIC, capacity, max_bodies, cadence, 0)
+
+    def advance(self, bodies, time: int | float) -> None:
+        """Moves the recorder clock time seconds forward, recording bodies if a frame is due"""
+        self.time += time
+        if self.time >= self.next_time:
+            self.record(bodies)
+            # The next multiple of cadence, even if a long step skipped some
+            self.next_time += self.cadence * ((self.time - self.next_time) // self.cadence + 1)
+
+    def record(self, bodies) -> None:
+        """Writes the current state of bodies into the next slot of the ring"""
+        frames = self.frames
+        number = int(self.header["frames_written"][0])
+        slot = number % len(frames)
+
+        count = len(bodies)
+        recorded = min(count, frames["ids"].shape[1])
+        if recorded < count and not self.warned:
+            warn(f"Only the first {recorded} of {count} bodies are recorded to {self.path}")
+            self.warned = True
+        ids = [self.id_of(body) for body in bodies[:recorded]]
+        # Readers look up the names of the ids in a frame once it is done
+        self.names_file.flush()
+
+        # Readers skip a slot while its seq is -1 (see TrajectoryReader.frame())
+        frames["seq"][slot] = -1
+        frames["time"][slot] = self.time
+        frames["count"][slot] = count
+        frames["ids"][slot, :recorded] = ids
+        if is_body_store(bodies):
+            frames["pos"][slot, :recorded] = bodies.pos[:recorded]
+            frames["speed"][slot, :recorded] = bodies.speed[:recorded]
+            frames["radius"][slot, :recorded] = bodies.radius[:recorded]
+        else:
+            frames["pos"][slot, :recorded] = [body.pos for body in bodies[:recorded]]
+            frames["speed"][slot, :recorded] = [body.speed for body in bodies[:recorded]]
+            frames["radius"][slot, :recorded] = [body.radius for body in bodies[:recorded]]
+        frames["seq"][slot] = number
+        self.header["frames_written"] = number + 1
+
+    def id_of(self, body) -> int:
+        recorder_id = self.ids.get(id(body))
+        if recorder_id is None:
+            recorder_id = self.ids[id(body)] = len(self.names)
+            self.names.append(body.name)
+            self.known.append(body)
+            self.names_file.write(json.dumps(body.name) + "\n")
+        return recorder_id
+
+    def close(self) -> None:
+        self.header.flush()
+        self.frames.flush()
+        self.names_file.close()
+
+class TrajectoryReader:
+    """Reads a file written by TrajectoryRecorder, also while it is being written
+
+    The frames are read straight from the memory map, so nothing is
+    copied until a frame is asked for.
+    """
+    __slots__ = ("path", "header", "frames")
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.header = np.memmap(path, dtype=HEADER, mode="r", shape=(1,))
+        if self.header[0]["magic"] != RECORDING_MAGIC:
+            raise ValueError(f"{path} is not a trajectory recording")
+        max_bodies = int(self.header[0]["max_bodies"])
+        capacity = int(self.header[0]["capacity"])
+        self.frames = np.memmap(path, dtype=frame_dtype(max_bodies), mode="r",
+                                offset=HEADER.itemsize, shape=(capacity,))
+
+    def available(self) -> range:
+        """Returns the numbers of the frames that are still in the ring, oldest first"""
+        written = int(self.header["frames_written"][0])
+        return range(max(0, written - len(self.frames)), written)
+
+    def frame(self, number: int) -> dict | None:
+        """Returns a copy of frame number as a dict, or None if it has been overwritten
+
+        The keys are time, count, ids, pos, speed and radius, with only
+        the recorded bodies in ids, pos, speed and radius.
+        """
+        frames = self.frames
+        slot = number % len(frames)
+        if frames["seq"][slot] != number:
+            return None
+        count = int(frames["count"][slot])
+        recorded = min(count, frames["ids"].shape[1])
+        frame = {"time": float(frames["time"][slot]),
+                 "count": count,
+                 "ids": frames["ids"][slot, :recorded].copy(),
+                 "pos": frames["pos"][slot, :recorded].copy(),
+                 "speed": frames["speed"][slot, :recorded].copy(),
+                 "radius": frames["radius"][slot, :recorded].copy()}
+        # The recorder might have started to overwrite it while copying
+        return frame if frames["seq"][slot] == number else None
+
+    def names(self) -> list[str]:
+        """Returns the body name of every recorder id handed out so far"""
+        try:
+            with open(self.path + NAMES_SUFFIX, encoding="utf-8") as file:
+                lines = file.read().split("\n")
+        except FileNotFoundError:
+            return []
+        # The last line is empty, or still being written
+        return [json.loads(line) for line in lines[:-1]]
@@ -0,0 +1,230 @@
+# Standard imports
+from time import perf_counter
+
+# Third party imports
+import numpy as np
+
+# Local imports
+from recorder import TrajectoryReader
+from background import Snapshot
+
+# How many keyframes back the trail of a replayed body goes
+REPLAY_TRAIL_FRAMES = 100
+
+# How much of the replay <Left> and <Right> skip
+REPLAY_SKIP_FRACTION = 0.01
+
+
+class ReplayBody:
+    """What draw.py needs from a Body, at one point of a replay"""
+    __slots__ = ("key", "name", "pos", "radius", "force", "trail_positions")
+
+    def __init__(self, key: int, name: str, pos: tuple[float, float], radius: float,
+                 trail_positions: list[tuple[float, float]]) -> None:
+        self.key = key  # The recorder id, see trail_key() in draw.py
+        self.name = name
+        self.pos = pos
+        self.radius = radius
+        self.force = (0.0, 0.0)  # Not recorded
+        self.trail_positions = trail_positions
+
+class Replay:
+    """Plays back a file written by TrajectoryRecorder, at any simulated time
+
+    Every recorded frame is a keyframe with the full state (position,
+    speed and radius) of every body. The keyframe index is the sorted
+    times of the frames still in the ring, so the two keyframes around
+    any time are found with a binary search, and their slots in the file
+    follow from the frame numbers. Positions between the two keyframes
+    come from cubic Hermite interpolation, which uses the recorded speeds
+    as the tangents and so follows the curve of an orbit.
+
+    Nothing is simulated, so jumping to any time costs the same, no
+    matter how long the recorded run was. The recording can still be
+    going on in another process, see refresh().
+    """
+    __slots__ = ("reader", "names", "written", "numbers", "times", "time", "trails", "trails_at")
+
+    def __init__(self, path: str) -> None:
+        self.reader = TrajectoryReader(path)
+        self.names = []
+        self.written = -1
+        self.trails = {}     # Recorder id -> trail up to the keyframe trails_at
+        self.trails_at = -1
+        self.refresh()
+        self.time = self.start
+
+    @property
+    def start(self) -> float:
+        return float(self.times[0])
+
+    @property
+    def end(self) -> float:
+        return float(self.times[-1])
+
+    def refresh(self) -> None:
+        """Rebuilds the keyframe index if frames have been recorded since the last time"""
+        written = int(self.reader.header["frames_written"][0])
+        if written == self.written:
+            return
+        frames = self.reader.frames
+        available = self.reader.available()
+        numbers = np.arange(available.start, available.stop)
+        slots = numbers % len(frames)
+        times = frames["time"][slots]
+        # Skip the frame the recorder is writing right now
+        complete = frames["seq"][slots] == numbers
+        numbers = numbers[complete]
+        times = times[complete]
+        if len(numbers) == 0:
+            raise ValueError(f"{self.reader.path} has no complete frames")
+
+        # A restored checkpoint makes the time jump back, only
+        # keep the frames recorded since the last jump
+        jumps = np.nonzero(np.diff(times) < 0)[0]
+        if len(jumps) > 0:
+            numbers = numbers[jumps[-1] + 1:]
+            times = times[jumps[-1] + 1:]
+
+        self.written = written
+        self.numbers = numbers
+        self.times = times
+        self.trails_at = -1
+        # New bodies may have been recorded since
+        self.names = self.reader.names()
+
+    def seek(self, time: float) -> None:
+        """Jumps to time, kept within the recorded frames"""
+        self.time = min(max(time, self.start), self.end)
+
+    def keyframe_before(self, time: float) -> int:
+        """Returns the index (in numbers and times) of the last keyframe at or before time"""
+        return max(0, int(np.searchsorted(self.times, time, side="right")) - 1)
+
+    def bodies_at(self, time: float) -> list[ReplayBody]:
+        """Returns the bodies as they were at time"""
+        index = self.keyframe_before(time)
+        before = self.reader.frame(int(self.numbers[index]))
+        after = None
+        if index + 1 < len(self.numbers) and time > self.times[index]:
+            after = self.reader.frame(int(self.numbers[index + 1]))
+        if before is None:
+            # Overwritten by a live recorder since the index was built
+            self.written = -1
+            self.refresh()
+            return self.bodies_at(time)
+
+        if after is None:
+            ids = before["ids"]
+            pos = before["pos"]
+            radius = before["radius"]
+        else:
+            # Only the bodies in both keyframes, the rest have just been eaten or added
+            ids, rows_before, rows_after = np.intersect1d(before["ids"], after["ids"],
+                                                          assume_unique=True, return_indices=True)
+            pos = hermite(before["pos"][rows_before], before["speed"][rows_before],
+                          after["pos"][rows_after], after["speed"][rows_after],
+                          before["time"], after["time"], time)
+            radius = before["radius"][rows_before]
+
+        trails = self.trails_up_to(index)
+        bodies = []
+        for recorder_id, body_pos, body_radius in zip(ids.tolist(), pos.tolist(), radius.tolist()):
+            body_pos = tuple(body_pos)
+            trail = trails.get(recorder_id, [])
+            bodies.append(ReplayBody(recorder_id, self.name_of(recorder_id), body_pos, body_radius,
+                                     trail + [body_pos]))
+        return bodies
+
+    def trails_up_to(self, index: int) -> dict[int, list[tuple[float, float]]]:
+        """Returns the positions in the last REPLAY_TRAIL_FRAMES keyframes up to index, by recorder id
+
+        Worked out once per keyframe, and kept until the replay moves on to another one.
+        """
+        if index == self.trails_at:
+            return self.trails
+
+        frames = self.reader.frames
+        numbers = self.numbers[max(0, index + 1 - REPLAY_TRAIL_FRAMES):index + 1]
+        slots = numbers % len(frames)
+        ids = frames["ids"][slots]
+        pos = frames["pos"][slots]
+        count = frames["count"][slots]
+        # Skip the frames that a live recorder has overwritten while copying
+        valid = (frames["seq"][slots] == numbers)[:, np.newaxis]
+        valid = valid & (np.arange(ids.shape[1]) < count[:, np.newaxis])
+
+        # Group the points by body, oldest first within every body
+        frame_index = np.broadcast_to(np.arange(len(numbers))[:, np.newaxis], ids.shape)[valid]
+        ids = ids[valid]
+        pos = pos[valid]
+        order = np.lexsort((frame_index, ids))
+        ids = ids[order]
+        pos = pos[order]
+        unique_ids, starts = np.unique(ids, return_index=True)
+        ends = np.append(starts[1:], len(ids))
+
+        points = list(map(tuple, pos.tolist()))
+        self.trails = {recorder_id: points[start:end]
+                       for recorder_id, start, end in zip(unique_ids.tolist(), starts.tolist(), ends.tolist())}
+        self.trails_at = index
+        return self.trails
+
+    def name_of(self, recorder_id: int) -> str:
+        """Returns the name of the body with recorder_id, or a made up one if it isn't written yet"""
+        if recorder_id < len(self.names):
+            return self.names[recorder_id]
+        return f"Body {recorder_id}"
+
+    def snapshot(self, simrate: float = 0) -> Snapshot:
+        """Returns a snapshot for redraw_all() at the current time of the replay"""
+        return Snapshot(self.bodies_at(self.time), None, self.time, simrate)
+
+def hermite(pos_0: np.ndarray, speed_0: np.ndarray, pos_1: np.ndarray, speed_1: np.ndarray,
+            time_0: float, time_1: float, time: float) -> np.ndarray:
+    """Returns the positions at time on the cubic curves from (pos_0, speed_0) at time_0 to (pos_1, speed_1) at time_1"""
+    step = time_1 - time_0
+    s = (time - time_0) / step
+    s2 = s*s
+    s3 = s2*s
+    return ((2*s3 - 3*s2 + 1) * pos_0
+            + (s3 - 2*s2 + s) * step * speed_0
+            + (-2*s3 + 3*s2) * pos_1
+            + (s3 - s2) * step * speed_1)
+
+def start_replay(app, path: str) -> None:
+    """Replays the recording at path in app instead of simulating"""
+    app.replay = Replay(path)
+    app.sim_sec_passed = app.replay.time
+    app.snapshot = app.replay.snapshot()
+    app.prev_frame_at = perf_counter()
+
+def show_replay_frame(app) -> None:
+    """Moves the replay forward by the simrate, to be drawn by redraw_all()"""
+    now = perf_counter()
+    app.frametime = now - app.prev_frame_at
+    app.frames_per_sec = 1/app.frametime if app.frametime > 0 else 0
+    app.prev_frame_at = now
+
+    replay = app.replay
+    replay.refresh()  # Picks up new frames if the recording is still going on
+    simrate = 0
+    if not app.sim_paused:
+        simrate = app.sec_to_sim_per_sec
+        replay.seek(replay.time + simrate*app.frametime)
+    app.snapshot = replay.snapshot(simrate)
+    app.sim_sec_passed = replay.time
+    app.actual_simrate = simrate
+
+def scrub_replay(app, fraction: float) -> None:
+    """Jumps to fraction (0 to 1) of the way through the replay"""
+    replay = app.replay
+    replay.seek(replay.start + fraction*(replay.end - replay.start))
+    app.snapshot = replay.snapshot(app.actual_simrate)
+    app.sim_sec_passed = replay.time
+
+def skip_replay(app, direction: int) -> None:
+    """Skips REPLAY_SKIP_FRACTION of the replay forward (direction 1) or back (-1)"""
+    replay = app.replay
+    fraction = (replay.time - replay.start) / max(replay.end - replay.start, 1)
+    scrub_replay(app, min(max(fraction + direction*REPLAY_SKIP_FRACTION, 0), 1))
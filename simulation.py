@@ -1,23 +1,100 @@
 # Standard imports
+from functools import partial
+from math import ceil
 from time import time
 
 # Local imports
-from body import merge_bodies, Body
+from body import Body
 from view import pix_to_pos
+from quadtree import set_barnes_hut_forces
+from pairwise import set_pairwise_forces, set_forces_on
+from collision import candidate_pairs, resolve_collisions
+from integrators import (INTEGRATORS, ADAPTIVE_INTEGRATORS, MAX_STEP, RK45_TOLERANCE, is_body_store,
+                         new_integrator_cache)
+from background import start_worker, stop_worker, show_latest_snapshot
+from general import model_changed
 
+try:
+    from body_store import BodyStore
+    from particles import create_particles
+    from parallel import ParallelForces
+    from checkpoint import save_checkpoint, load_checkpoint
+    from recorder import TrajectoryRecorder
+    from replay import start_replay, show_replay_frame
+except ModuleNotFoundError:
+    BodyStore = None  # NumPy is not installed, only the Python engine is available
+    create_particles = None
+    ParallelForces = None
+    save_checkpoint = load_checkpoint = None
+    TrajectoryRecorder = None
+    start_replay = show_replay_frame = None
+
+
+# Room in every recorded frame for bodies added after the
+# recording started, like placed Suns (see recorder.py)
+RECORD_SPARE_BODIES = 32
+
+
+def init_simulation(app, integrator: str = "yoshida", tolerance: float = RK45_TOLERANCE,
+                    belt: int = 0, far_cache: bool = False, workers: int = 0,
+                    background: bool = False, restore: str = None,
+                    record: str = None, record_every: float = 60*60*24, record_frames: int = 10000,
+                    replay: str = None) -> None:
+    # Increased by every change of the model, see model_changed()
+    app.model_version = 0
 
-def init_simulation(app) -> None:
     # SIM CONSTANTS
     app.TIME_AT_SIM_START = time()
 
-    app.MAX_TIME_TO_SIM = 60*60*10  # Never simulate more this many secs 
-                                    # at a time  (see simulate_bodies())
+    # How the bodies are moved forward in time (see integrators.py)
+    app.integrator = integrator
+    app.tolerance = tolerance  # Only used by adaptive integrators
+    app.integrator_cache = new_integrator_cache(integrator)  # Kept between steps, see simulate_bodies()
+
+    app.MAX_TIME_TO_SIM = MAX_STEP[integrator]  # Never simulate more this many secs 
+                                                # at a time  (see simulate_bodies())
 
     app.MAX_SIMRATE = 60*60*24*100  # Limit the speed of simulation
 
     app.timer_delay = 20   # Basically sets a min frametime of 20ms (50FPS).
                            # This desides how often timer_fired(app) is called
 
+    # Keep the bodies in NumPy arrays and use the vectorized gravity
+    # kernel if NumPy is available (see body_store.py), else use the
+    # pure Python pair kernel (see pairwise.py)
+    app.force_mode = "numpy" if BodyStore is not None else "pairwise"
+    if app.force_mode == "numpy":
+        app.bodies = BodyStore(app.bodies)
+        if far_cache:
+            # Only refresh the weak far pulls now and then
+            # (see BodyStore.compute_cached_forces())
+            app.force_mode = "far_cache"
+
+    # Split the forces between this many processes (see parallel.py)
+    app.force_pool = None
+    if workers < 0 or workers == 1:
+        raise ValueError(f"workers must be 0 (no worker processes) or at least 2, not {workers}")
+    if workers > 1 and far_cache:
+        raise ValueError("The far-field cache can't be used with worker processes")
+    if workers > 1:
+        if ParallelForces is None:
+            raise ModuleNotFoundError("The parallel force engine needs NumPy (pip install numpy)")
+        app.force_pool = ParallelForces(workers)
+        app.force_mode = "parallel"
+    app.default_force_mode = app.force_mode
+
+    # Opening angle used when app.force_mode is "barnes_hut".
+    # Lower is more accurate, higher is faster (see quadtree.py)
+    app.theta = 0.5
+
+    # Massless asteroid belt with this many particles (see particles.py)
+    if belt > 0 and create_particles is None:
+        raise ModuleNotFoundError("The asteroid belt needs NumPy (pip install numpy)")
+    app.particles = create_particles(belt, app.sun) if belt > 0 else None
+
+    # Forces for the first step (leapfrog starts with half a kick)
+    refresh_forces(app.bodies, app.force_mode, app.theta, app.force_pool, app.particles)
+
     # SIM VARIABLES (Start Values)
     app.sim_paused = False
     app.frametime = app.timer_delay/1000  # Seconds
@@ -39,6 +116,76 @@ def init_simulation(app) -> None:
     app.upaused_at = 0
     app.paused_sec_passed = 0  # How many seconds the sim has been passed
 
+    # Continue from a saved checkpoint (see checkpoint.py)
+    if restore is not None:
+        if load_checkpoint is None:
+            raise ModuleNotFoundError("Checkpoints need NumPy (pip install numpy)")
+        load_checkpoint(app, restore)
+
+    # Record the positions and speeds every record_every simulated
+    # seconds into a ring buffer file of record_frames frames (see recorder.py)
+    app.recorder = None
+    if record is not None:
+        if TrajectoryRecorder is None:
+            raise ModuleNotFoundError("Recording needs NumPy (pip install numpy)")
+        app.recorder = TrajectoryRecorder(record, record_every, len(app.bodies) + RECORD_SPARE_BODIES,
+                                          record_frames, app.sim_sec_passed)
+        app.recorder.record(app.bodies)
+
+    # Step the simulation in a background thread, and only draw
+    # its latest snapshot in the Tk thread (see background.py)
+    app.worker = None
+    app.snapshot = None
+    if background:
+        start_worker(app, simulate_bodies)
+
+    # Play back a recording instead of simulating, drawn from
+    # app.snapshot like with a background worker (see replay.py)
+    app.replay = None
+    if replay is not None:
+        if start_replay is None:
+            raise ModuleNotFoundError("Replays need NumPy (pip install numpy)")
+        if background:
+            raise ValueError("A replay can't be stepped in the background")
+        start_replay(app, replay)
+
+def stop_simulation(app) -> None:
+    """Stops the background worker and the parallel force engine, and closes the recording"""
+    if app.worker is not None:
+        stop_worker(app)
+    if app.recorder is not None:
+        app.recorder.close()
+        app.recorder = None
+    if app.force_pool is not None:
+        app.force_pool.close()
+        app.force_pool = None
+
+def save_simulation(app, path: str) -> None:
+    """Saves a checkpoint of the simulation to path (see checkpoint.py)"""
+    if save_checkpoint is None:
+        raise ModuleNotFoundError("Checkpoints need NumPy (pip install numpy)")
+    # The bodies can't change while they are saved
+    background = app.worker is not None
+    if background:
+        stop_worker(app)
+    save_checkpoint(app, path)
+    if background:
+        start_worker(app, simulate_bodies)
+
+def restore_simulation(app, path: str) -> None:
+    """Replaces the simulation with the checkpoint at path (see checkpoint.py)"""
+    if load_checkpoint is None:
+        raise ModuleNotFoundError("Checkpoints need NumPy (pip install numpy)")
+    background = app.worker is not None
+    if background:
+        stop_worker(app)
+    load_checkpoint(app, path)
+    if app.recorder is not None:
+        # Go on recording from the restored time
+        app.recorder.time = app.recorder.next_time = app.sim_sec_passed
+    if background:
+        start_worker(app, simulate_bodies)
+
 def change_desired_simrate(app, option) -> None:
     """Changes the sec_to_sim_per_sec (desired_simrate)"""
 
@@ -90,19 +237,47 @@ def unpause_sim(app) -> None:
     app.unpaused_at = time()
     app.paused_sec_passed += app.unpaused_at - app.paused_at
 
+def toggle_barnes_hut(app) -> None:
+    """Switches between the Barnes–Hut approximation and the default force mode"""
+    if app.force_mode == "barnes_hut":
+        app.force_mode = app.default_force_mode
+    else:
+        app.force_mode = "barnes_hut"
+
 def place_sun(app, mouse_pos: tuple[int, int]) -> None:
     app.num_of_new_suns += 1
-    if app.sun.static:
-        app.sun.static = False
+
+    x, y = pix_to_pos(app, mouse_pos)
+    new_sun = create_sun(x, y, app.num_of_new_suns)
+
+    if app.worker is not None:
+        # The bodies belong to the worker thread while it runs
+        app.worker.submit(partial(add_placed_sun, app, new_sun, particles=app.worker.particles))
+    else:
+        add_placed_sun(app, new_sun, app.bodies, app.particles)
+
+def add_placed_sun(app, new_sun: Body, bodies, particles) -> None:
+    """Adds new_sun to bodies, with forces that include its pull"""
+    add_sun(app.sun, new_sun, bodies)
+    refresh_forces(bodies, app.force_mode, app.theta, app.force_pool, particles)
+    if app.integrator_cache is not None:
+        app.integrator_cache.reset()
+
+def create_sun(x: float, y: float, number: int) -> Body:
+    """Returns a new Sun at rest at (x, y), like the ones placed with the mouse"""
+    return Body(pos_x=x, pos_y=y,
+                speed_x=0, speed_y=0,
+                mass=1.9885*10**30, density=1408,
+                name = f"New Sun {number}")
+
+def add_sun(sun: Body, new_sun: Body, bodies) -> None:
+    """Adds new_sun to bodies, and lets the first Sun move from now on"""
+    if sun.static:
+        sun.static = False
     else:
         pass
 
-    x, y = pix_to_pos(app, mouse_pos)
-    new_sun =  Body(pos_x=x, pos_y=y,
-                    speed_x=0, speed_y=0,
-                    mass=1.9885*10**30, density=1408,
-                    name = f"New Sun {app.num_of_new_suns}")
-    app.bodies.append(new_sun)
+    bodies.append(new_sun)
 
 def current_actual_simrate(app) -> float:
     """Return current actual simrate"""
@@ -130,7 +305,12 @@ def update_frametime_adjust_sec_to_sim_per_frame(func):
     and somewhat equal to the desired_simrate.
     """
     def wraper(app):
-        if not app.sim_paused:
+        model_changed(app)
+        if app.worker is not None or app.replay is not None:
+            # The worker thread (or the replay) keeps the simrate itself,
+            # this only picks up the next snapshot (see background.py)
+            func(app)
+        elif not app.sim_paused:
             # Time the func
             func_start = time()
             func(app)
@@ -153,35 +333,143 @@ def update_frametime_adjust_sec_to_sim_per_frame(func):
 
     return wraper
 
-def simulate_bodies(bodies, time: int | float, max_time: int) -> None:
+def compute_forces(bodies, force_mode: str = "direct", theta: float = 0.5,
+                   active: list[int] = None, force_pool=None) -> list[tuple[Body, Body]] | None:
+    """Sets the force on every body from all the other bodies
+
+    force_mode:
+        "direct":     Body.force_from() for every pair of bodies, O(n²)
+        "pairwise":   Every pair once in pure Python, O(n²/2) (see pairwise.py)
+        "numpy":      All pairs at once in NumPy, O(n²) (bodies must be a BodyStore)
+        "far_cache":  Like "numpy", but the weak far pulls are cached and only
+                      refreshed now and then (bodies must be a BodyStore)
+        "parallel":   Like "numpy", split between the worker processes of
+                      force_pool, a ParallelForces (see parallel.py)
+        "barnes_hut": Quadtree approximation with opening angle theta, O(n log n)
+
+    If active (body indices) is given, only the force on those bodies is set.
+
+    Returns the pairs of collided bodies if the force mode finds
+    them along the way, else None.
+    """
+    if force_mode == "direct" and is_body_store(bodies):
+        # Body.force_from() only takes a list, a BodyStore has its own O(n²) kernel
+        force_mode = "numpy"
+
+    if force_mode == "direct":
+        for index in (range(len(bodies)) if active is None else active):
+            bodies[index].force = bodies[index].force_from(bodies)
+    elif force_mode == "pairwise":
+        if active is None:
+            return set_pairwise_forces(bodies)
+        set_forces_on(bodies, active)
+    elif force_mode == "numpy":
+        bodies.compute_forces(active)
+    elif force_mode == "far_cache":
+        bodies.compute_cached_forces(active)
+    elif force_mode == "parallel":
+        force_pool.compute_forces(bodies, active)
+    elif force_mode == "barnes_hut":
+        set_barnes_hut_forces(bodies, theta, active)
+    else:
+        raise ValueError(f"Unknown force mode {force_mode!r}")
+    return None
+
+def refresh_forces(bodies, force_mode: str = "direct", theta: float = 0.5,
+                   force_pool=None, particles=None) -> None:
+    """Sets the force on every body, and the accelerations of the particles, from scratch
+
+    Needed whenever bodies are merged or added between steps. Leapfrog
+    (and the block steps) start with half a kick with the forces from
+    the end of the last step, which would still have the pull of the
+    eaten bodies, and no pull from (or on) a new one.
+    """
+    compute_forces(bodies, force_mode, theta, force_pool=force_pool)
+    if particles is not None:
+        particles.update_accelerations(bodies)
+
+def find_collisions(bodies) -> list[tuple[Body, Body]]:
+    """Returns all pairs of bodies which have collided with each other
+
+    Only the candidates from the broad-phase (see collision.py)
+    get the exact Body.collision_with() test.
+    """
+    if is_body_store(bodies):
+        return bodies.colliding_pairs()
+
+    colliding = []
+    for i, j in candidate_pairs(bodies):
+        if bodies[i].collision_with(bodies[j]):
+            colliding.append((bodies[i], bodies[j]))
+    return colliding
+
+def simulate_bodies(bodies, time: int | float, max_time: int,
+                    force_mode: str = "direct", theta: float = 0.5,
+                    integrator: str = "euler", tolerance: float = RK45_TOLERANCE,
+                    particles=None, force_pool=None, recorder=None, integrator_cache=None) -> None:
     """Modifies bodies list after simulated time
     
     Not using return of new list due to perfomance
+
+    Massless particles (see particles.py) are moved with kick-drift-kick
+    leapfrog alongside the bodies, using the body positions from the
+    start and the end of every step.
+
+    A recorder (see recorder.py) gets the bodies after every step, and
+    writes a frame whenever one is due.
+
+    integrator_cache is what the integrator keeps between calls (see
+    INTEGRATOR_CACHES in integrators.py), None to keep nothing.
     """
     
     # If it wants to simulate more than max_time
     # we have to split it up into max_time chuncks 
     # for a somewhat accurate simulation
     if time > max_time:
-        repeat = int(time/(max_time))
+        repeat = ceil(time/max_time)
+        time = time/repeat
     else:
         repeat = 1
 
+    step = INTEGRATORS[integrator]
+    if integrator in ADAPTIVE_INTEGRATORS:
+        step = partial(step, tolerance=tolerance)
+    if integrator_cache is not None:
+        step = partial(step, cache=integrator_cache)
     for _ in range(repeat):
+        if particles is not None:
+            particles.kick(time/2)
+
+        # Calculate new postions and speeds (see integrators.py)
+        colliding = step(bodies, time, lambda active=None:
+                         compute_forces(bodies, force_mode, theta, active, force_pool))
+
+        if particles is not None:
+            particles.drift(time)
+            particles.update_accelerations(bodies)
+            particles.kick(time/2)
+
+        # Check if any body eats smaller bodies. Done at the end of the
+        # step so force modes can report collisions from the new positions.
+        if colliding is None:
+            colliding = find_collisions(bodies)
+        if colliding:
+            resolve_collisions(colliding, bodies)
+            refresh_forces(bodies, force_mode, theta, force_pool, particles)
+            if integrator_cache is not None:
+                integrator_cache.reset()
+
+        update_trails(bodies)
+
+        if recorder is not None:
+            recorder.advance(bodies, time)
+
+def update_trails(bodies) -> None:
+    """Moves the end of every trail to the current position of its body"""
+    if is_body_store(bodies):
+        bodies.update_trails()  # All at once (see body_store.py)
+    else:
         for body in bodies:
-            # Check if this body eats a smaller body
-            for other_body in bodies:
-                if (body is not other_body and
-                    body.collision_with(other_body) and
-                    body.mass >= other_body.mass):
-                    merge_bodies(body, other_body, bodies)
-            # Calculate new postion
-            if not body.static:
-                body.pos = body.pos_after(time)
-        # Give all bodies their new speeds given new force and pos
-        for body in bodies:
-            body.force = body.force_from(bodies)
-            body.speed = body.speed_after(time)
             body.update_trail()
 
 @update_frametime_adjust_sec_to_sim_per_frame
@@ -189,7 +477,13 @@ def timer_fired(app) -> None:
     """Called every app.timer_delay ms"""
     # Every time app.bodies is changed, the app redraws the frame
     # Thus the exec. time of timer_fired is basically the frametime
-    if not app.sim_paused:
-        simulate_bodies(app.bodies, app.sec_to_sim_per_frame, app.MAX_TIME_TO_SIM)
+    if app.replay is not None:
+        show_replay_frame(app)
+    elif app.worker is not None:
+        show_latest_snapshot(app)
+    elif not app.sim_paused:
+        simulate_bodies(app.bodies, app.sec_to_sim_per_frame, app.MAX_TIME_TO_SIM,
+                        app.force_mode, app.theta, app.integrator, app.tolerance,
+                        app.particles, app.force_pool, app.recorder, app.integrator_cache)
     else: 
         pass
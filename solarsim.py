@@ -0,0 +1,323 @@
+# Standard imports
+from argparse import ArgumentParser, ArgumentTypeError
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from csv import DictWriter
+from itertools import product
+from os import makedirs, path
+from random import Random
+from sys import stdout
+from time import perf_counter
+from types import SimpleNamespace
+
+# Local imports
+from body import PI, init_bodies, total_energy
+from general import practical_time_string_to_sec, sec_to_practical_time_string
+from integrators import INTEGRATORS, ADAPTIVE_INTEGRATORS, MAX_STEP, RK45_TOLERANCE
+from simulation import init_simulation, simulate_bodies, stop_simulation, create_sun, add_sun
+
+try:
+    import numpy as np
+    from ensemble import Ensemble
+    from checkpoint import save_checkpoint
+except ModuleNotFoundError:
+    np = None  # Only needed for ensembles and checkpoints
+    Ensemble = None
+    save_checkpoint = None
+
+YEAR = 60*60*24*365  # Seconds, same year as sec_to_practical_time_string()
+AU = 149.6*10**9     # Astronomical unit (m)
+
+# How much time to give simulate_bodies() per call. It splits
+# it into steps of dt itself, this only decides how often the
+# trails are updated and the progress is checked.
+CHUNK_STEPS = 100
+
+
+def init_state(mass_jitter: float = 0, seed: int = None,
+               suns: list[tuple[float, float]] = (), **options) -> SimpleNamespace:
+    """Returns a plain state object with the init_bodies() scenario
+
+    Takes the same options as init_simulation(), and has the
+    same attributes as the app (bodies, force_mode, integrator, ...),
+    just without a window.
+
+    The scenario can be varied first:
+        mass_jitter: Scale the mass of every body by a random factor
+                     in [1 - mass_jitter, 1 + mass_jitter] (using seed)
+        suns:        Add a new Sun at each (x, y) position (m), like place_sun()
+    """
+    state = SimpleNamespace()
+    init_bodies(state)
+
+    if mass_jitter:
+        rng = Random(seed)
+        for body in state.bodies:
+            body.mass *= rng.uniform(1 - mass_jitter, 1 + mass_jitter)
+            body.radius = round(((body.mass/body.density)*(3/(4*PI)))**(1/3))
+
+    for x, y in suns:
+        state.num_of_new_suns += 1
+        add_sun(state.sun, create_sun(x, y, state.num_of_new_suns), state.bodies)
+
+    init_simulation(state, **options)
+    return state
+
+def run(state, sim_time: float, dt: float) -> int:
+    """Simulates state for sim_time seconds in steps of dt, as fast as possible
+
+    Returns the number of steps taken. An adaptive integrator picks its
+    own steps, dt only caps them, so for it they are counted by its
+    cache (see RK45Steps in integrators.py).
+    """
+    if not dt > 0:
+        raise ValueError(f"dt has to be longer than 0, not {dt}")
+    adaptive = state.integrator in ADAPTIVE_INTEGRATORS
+    taken = state.integrator_cache.taken if adaptive else 0
+    steps = 0
+    time_left = sim_time
+    while time_left > 0:
+        chunk = min(CHUNK_STEPS * dt, time_left)
+        simulate_bodies(state.bodies, chunk, dt,
+                        state.force_mode, state.theta, state.integrator, state.tolerance,
+                        state.particles, state.force_pool, state.recorder, state.integrator_cache)
+        steps += -(-chunk // dt)  # Same rounding up as in simulate_bodies()
+        time_left -= chunk
+        state.sim_sec_passed += chunk
+    if adaptive:
+        return state.integrator_cache.taken - taken
+    return int(steps)
+
+def run_case(case: dict) -> dict:
+    """Runs one case of a sweep and returns its row in the results table
+
+    case has the columns of SWEEP_COLUMNS up to runtime_s. Runs in a
+    worker process of sweep(), so it only takes and returns plain values.
+    """
+    dt = case["dt"] or MAX_STEP[case["integrator"]]
+    suns = [(x*AU, y*AU) for x, y in case["suns"]]
+    state = init_state(mass_jitter=case["mass_jitter"], seed=case["seed"], suns=suns,
+                       integrator=case["integrator"], tolerance=case["tolerance"])
+    num_of_bodies = len(state.bodies)
+    start_energy = total_energy(state.bodies)
+
+    start = perf_counter()
+    steps = run(state, case["years"] * YEAR, dt)
+    runtime = perf_counter() - start
+
+    row = dict(case, suns=format_suns(case["suns"]))
+    row.update(dt=dt,
+               steps=steps,
+               runtime_s=round(runtime, 3),
+               merges=num_of_bodies - len(state.bodies),
+               bodies_left=len(state.bodies),
+               energy_drift=abs((total_energy(state.bodies) - start_energy) / start_energy),
+               state="",
+               error="")
+    if case["state_dir"]:
+        row["state"] = path.join(case["state_dir"], f"case_{case['case']}.npz")
+        save_checkpoint(state, row["state"])
+    return row
+
+def parse_step(text: str) -> float:
+    """practical_time_string_to_sec() for --dt, which has to be longer than 0"""
+    step = practical_time_string_to_sec(text)
+    if not step > 0:
+        raise ArgumentTypeError(f"the step has to be longer than 0, not {text!r}")
+    return step
+
+def parse_suns(text: str) -> list[tuple[float, float]]:
+    """'none' -> [].  '1,2' -> [(1, 2)].  '1,2;-3,0.5' -> [(1, 2), (-3, 0.5)]"""
+    if text == "none":
+        return []
+    suns = []
+    for sun in text.split(";"):
+        values = sun.split(",")
+        if len(values) != 2:
+            raise ArgumentTypeError(f"a Sun is placed at x,y, not {sun!r}")
+        suns.append((float(values[0]), float(values[1])))
+    return suns
+
+def format_suns(suns: list[tuple[float, float]]) -> str:
+    """The opposite of parse_suns()"""
+    if not suns:
+        return "none"
+    return ";".join(f"{x:g},{y:g}" for x, y in suns)
+
+# The columns of the results table written by sweep()
+SWEEP_COLUMNS = ["case", "integrator", "dt", "tolerance", "mass_jitter", "seed", "suns", "years",
+                 "state_dir", "steps", "runtime_s", "merges", "bodies_left", "energy_drift", "state", "error"]
+
+def sweep(cases: list[dict], results, jobs: int = None) -> None:
+    """Runs every case in a pool of jobs processes
+
+    A row is written to the CSV file results as soon as its case is
+    done, so the rows are in the order the cases finish. A case that
+    fails gets a row with only its settings and the error, and the
+    other cases go on.
+    """
+    writer = DictWriter(results, SWEEP_COLUMNS)
+    writer.writeheader()
+    with ProcessPoolExecutor(jobs) as pool:
+        futures = {pool.submit(run_case, case): case for case in cases}
+        for future in as_completed(futures):
+            try:
+                row = future.result()
+            except Exception as error:
+                case = futures[future]
+                row = dict(case, suns=format_suns(case["suns"]), error=f"{type(error).__name__}: {error}")
+            writer.writerow(row)
+            results.flush()
+
+def run_ensemble(args) -> None:
+    """The 'ensemble' command: steps args.copies copies of init_bodies() as one batch"""
+    if Ensemble is None:
+        raise ModuleNotFoundError("Ensembles need NumPy (pip install numpy)")
+
+    dt = args.dt or MAX_STEP[args.integrator]
+    state = SimpleNamespace()
+    init_bodies(state)
+    ensemble = Ensemble.from_bodies(state.bodies, args.copies, args.mass_jitter, args.seed)
+    start_energy = ensemble.total_energy()
+    print(f"Simulating {args.years:g} years of {args.copies} copies of {len(state.bodies)} bodies "
+          f"with {args.integrator}, dt = {sec_to_practical_time_string(dt)}")
+
+    start = perf_counter()
+    steps = ensemble.simulate(args.years * YEAR, dt, args.integrator)
+    wall_time = perf_counter() - start
+
+    drift = np.abs((ensemble.total_energy() - start_energy) / start_energy)
+    merged = (~ensemble.alive).sum(axis=1)
+    print(f"{steps} steps in {wall_time:.2f} s: {steps*args.copies/wall_time:.0f} copy-steps/s, "
+          f"{args.years*args.copies/wall_time:.3g} simulated years per second")
+    print(f"Energy drift: median {np.median(drift):.2e}, max {drift.max():.2e}. "
+          f"{int((merged > 0).sum())} copies had merges")
+
+    if args.out:
+        np.savez(args.out, name=np.array(ensemble.names, dtype=str), pos=ensemble.pos,
+                 speed=ensemble.speed, mass=ensemble.mass, alive=ensemble.alive,
+                 time=args.years * YEAR)
+        print(f"Saved the final state to {args.out}")
+
+def main(argv: list[str] = None) -> None:
+    parser = ArgumentParser(prog="python -m solarsim",
+                            description="Solar System Sim without a window")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="simulate the solar system and print the throughput")
+    run_parser.add_argument("--years", type=float, default=1,
+                            help="how many years to simulate (default: 1)")
+    run_parser.add_argument("--dt", type=parse_step, default=None,
+                            help="step size, like 3600, 1h or 2d (default: largest safe step of the integrator)")
+    run_parser.add_argument("--out", default=None,
+                            help="save a checkpoint of the final state to this .npz file (needs NumPy)")
+    run_parser.add_argument("--restore", default=None,
+                            help="continue from a checkpoint .npz, saved by --out or the <S> key (needs NumPy)")
+    run_parser.add_argument("--record", default=None,
+                            help="record the positions and speeds into this ring buffer file (needs NumPy)")
+    run_parser.add_argument("--record-every", type=practical_time_string_to_sec, default=60*60*24,
+                            help="simulated time between recorded frames (default: 1d)")
+    run_parser.add_argument("--record-frames", type=int, default=10000,
+                            help="frames in the ring buffer, the oldest are overwritten (default: 10000)")
+    run_parser.add_argument("--integrator", choices=INTEGRATORS, default="yoshida",
+                            help="how the bodies are moved forward in time (default: yoshida)")
+    run_parser.add_argument("--tolerance", type=float, default=RK45_TOLERANCE,
+                            help=f"error tolerance for adaptive integrators (default: {RK45_TOLERANCE})")
+    run_parser.add_argument("--belt", type=int, default=0,
+                            help="number of massless particles in the asteroid belt (default: 0)")
+    # The worker processes always compute every pull, so the two don't mix
+    force_engine = run_parser.add_mutually_exclusive_group()
+    force_engine.add_argument("--far-cache", action="store_true",
+                              help="only refresh the weak far-field pulls every few steps (needs NumPy)")
+    force_engine.add_argument("--workers", type=int, default=0,
+                              help="split the gravity between this many processes, at least 2 (needs NumPy)")
+
+    sweep_parser = commands.add_parser("sweep", help="run every combination of the given values in parallel")
+    sweep_parser.add_argument("--years", type=float, default=1,
+                              help="how many years to simulate every case (default: 1)")
+    sweep_parser.add_argument("--integrator", nargs="+", choices=INTEGRATORS, default=["yoshida"],
+                              help="integrators to try (default: yoshida)")
+    sweep_parser.add_argument("--dt", nargs="+", type=parse_step, default=[None],
+                              help="step sizes to try (default: largest safe step of the integrator)")
+    sweep_parser.add_argument("--tolerance", type=float, default=RK45_TOLERANCE,
+                              help=f"error tolerance for adaptive integrators (default: {RK45_TOLERANCE})")
+    sweep_parser.add_argument("--mass-jitter", nargs="+", type=float, default=[0],
+                              help="relative random change of every mass, like 0.01 for ±1%% (default: 0)")
+    sweep_parser.add_argument("--seeds", nargs="+", type=int, default=[0],
+                              help="random seeds for the mass jitter (default: 0)")
+    sweep_parser.add_argument("--suns", nargs="+", type=parse_suns, default=[[]],
+                              help="extra Suns to place, in AU: none, x,y or x,y;x,y;... (default: none)")
+    sweep_parser.add_argument("--jobs", type=int, default=None,
+                              help="number of processes (default: one per core)")
+    sweep_parser.add_argument("--out", default=None,
+                              help="write the results table (CSV) to this file (default: print it)")
+    sweep_parser.add_argument("--state-dir", default="",
+                              help="save the final state of every case as an .npz in this folder (needs NumPy)")
+
+    ensemble_parser = commands.add_parser("ensemble", help="step many perturbed copies at once in NumPy (needs NumPy)")
+    ensemble_parser.add_argument("--copies", type=int, default=1000,
+                                 help="number of copies of the solar system (default: 1000)")
+    ensemble_parser.add_argument("--years", type=float, default=1,
+                                 help="how many years to simulate (default: 1)")
+    ensemble_parser.add_argument("--dt", type=parse_step, default=None,
+                                 help="step size, like 3600, 1h or 2d (default: largest safe step of the integrator)")
+    ensemble_parser.add_argument("--integrator", choices=("euler", "leapfrog", "verlet", "yoshida"),
+                                 default="yoshida", help="how the copies are moved forward in time (default: yoshida)")
+    ensemble_parser.add_argument("--mass-jitter", type=float, default=0.01,
+                                 help="relative random change of every mass, like 0.01 for ±1%% (default: 0.01)")
+    ensemble_parser.add_argument("--seed", type=int, default=None,
+                                 help="random seed for the mass jitter")
+    ensemble_parser.add_argument("--out", default=None,
+                                 help="save the final state of all copies to this .npz file")
+    args = parser.parse_args(argv)
+
+    if args.command == "ensemble":
+        run_ensemble(args)
+        return
+
+    if args.command == "sweep":
+        grid = product(args.integrator, args.dt, args.mass_jitter, args.seeds, args.suns)
+        cases = [dict(case=index, integrator=integrator, dt=dt, tolerance=args.tolerance,
+                      mass_jitter=mass_jitter, seed=seed, suns=suns, years=args.years,
+                      state_dir=args.state_dir)
+                 for index, (integrator, dt, mass_jitter, seed, suns) in enumerate(grid)]
+        if args.state_dir:
+            # Before any case is run, not after each one is done
+            if save_checkpoint is None:
+                raise ModuleNotFoundError("Saving the states needs NumPy (pip install numpy)")
+            makedirs(args.state_dir, exist_ok=True)
+        if args.out:
+            with open(args.out, "w", newline="") as results:
+                sweep(cases, results, args.jobs)
+            print(f"Wrote {len(cases)} cases to {args.out}")
+        else:
+            sweep(cases, stdout, args.jobs)
+        return
+
+    state = init_state(integrator=args.integrator, tolerance=args.tolerance, belt=args.belt,
+                       far_cache=args.far_cache, workers=args.workers, restore=args.restore,
+                       record=args.record, record_every=args.record_every, record_frames=args.record_frames)
+    # A checkpoint brings its own integrator
+    dt = args.dt or MAX_STEP[state.integrator]
+    num_of_bodies = len(state.bodies)
+    print(f"Simulating {args.years:g} years of {num_of_bodies} bodies with {state.integrator}, "
+          f"dt = {sec_to_practical_time_string(dt)}, gravity: {state.force_mode}")
+
+    start = perf_counter()
+    try:
+        steps = run(state, args.years * YEAR, dt)
+    finally:
+        stop_simulation(state)
+    wall_time = perf_counter() - start
+
+    print(f"{steps} steps in {wall_time:.2f} s: {steps/wall_time:.0f} steps/s, "
+          f"{args.years/wall_time:.3g} simulated years per second")
+    print(f"{num_of_bodies - len(state.bodies)} bodies merged, {len(state.bodies)} left")
+
+    if args.out:
+        if save_checkpoint is None:
+            raise ModuleNotFoundError("Saving the state needs NumPy (pip install numpy)")
+        save_checkpoint(state, args.out)
+        print(f"Saved the final state to {args.out}")
+
+if __name__ == "__main__":
+    main()
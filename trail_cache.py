@@ -0,0 +1,163 @@
+# Standard imports
+from collections import deque
+from itertools import islice
+
+# A simplified trail is never further than this from the trail it stands for
+TRAIL_LOD_PIXELS = 1
+
+# A simplified trail is built again when the zoom has changed by more
+# than this factor since it was built, in or out
+TRAIL_LOD_ZOOM_FACTOR = 1.5
+
+
+class SimplifiedTrail:
+    """A trail with only the points needed to draw it within TRAIL_LOD_PIXELS at one zoom
+
+    Built one saved position at a time, like Douglas–Peucker but
+    greedy: the positions after the last kept one are held back as long
+    as a straight line from the last kept one to the newest passes
+    within tolerance of all of them. When it doesn't, the one before the
+    newest is kept.
+    """
+    __slots__ = ("zoom", "tolerance", "points", "numbers", "anchor", "pending", "last", "seen", "box")
+
+    def __init__(self, zoom: float) -> None:
+        self.zoom = zoom
+        self.tolerance = TRAIL_LOD_PIXELS / zoom  # Meters
+        self.points = deque()   # The kept saved positions, oldest first
+        self.numbers = deque()  # Which saved position (counting from the first seen) each one is
+        self.anchor = None      # Last kept position, even if the trail has dropped it
+        self.pending = deque()  # (number, position) after the anchor, held back
+        self.last = None        # Last saved position taken in
+        self.seen = 0           # Saved positions taken in so far
+        self.box = None         # (min_x, min_y, max_x, max_y) of the saved positions, None if not known
+
+    def take_in(self, points) -> None:
+        """Adds new saved positions to the end"""
+        for point in points:
+            if self.anchor is None:
+                self.keep(self.seen, point)
+            elif self.pending and self.strays(point):
+                number, kept = self.pending[-1]
+                self.keep(number, kept)
+                self.pending.append((self.seen, point))
+            else:
+                self.pending.append((self.seen, point))
+            self.last = point
+            self.seen += 1
+            if self.box is not None:
+                min_x, min_y, max_x, max_y = self.box
+                self.box = (min(min_x, point[0]), min(min_y, point[1]),
+                            max(max_x, point[0]), max(max_y, point[1]))
+
+    def keep(self, number: int, point: tuple[float, float]) -> None:
+        self.points.append(point)
+        self.numbers.append(number)
+        self.anchor = point
+        self.pending.clear()
+
+    def strays(self, point: tuple[float, float]) -> bool:
+        """Return true if a held back position is too far from the line from the anchor to point"""
+        start_x, start_y = self.anchor
+        line_x = point[0] - start_x
+        line_y = point[1] - start_y
+        length_squared = line_x*line_x + line_y*line_y
+        for _, (pos_x, pos_y) in self.pending:
+            delta_x = pos_x - start_x
+            delta_y = pos_y - start_y
+            # Closest point on the line, as a fraction of the way along it
+            along = 0
+            if length_squared > 0:
+                along = min(max((delta_x*line_x + delta_y*line_y) / length_squared, 0), 1)
+            off_x = delta_x - along*line_x
+            off_y = delta_y - along*line_y
+            if off_x*off_x + off_y*off_y > self.tolerance*self.tolerance:
+                return True
+        return False
+
+    def drop_before(self, number: int) -> None:
+        """Drops the positions older than saved position number"""
+        while self.numbers and self.numbers[0] < number:
+            self.points.popleft()
+            self.numbers.popleft()
+            self.box = None
+        while self.pending and self.pending[0][0] < number:
+            self.pending.popleft()
+            self.box = None
+
+    def bounds(self, first: tuple[float, float], current: tuple[float, float]) -> tuple[float, float, float, float]:
+        """Returns (min_x, min_y, max_x, max_y) around the whole trail, from first to current"""
+        if self.box is None:
+            points = [first, *self.points, *(point for _, point in self.pending)]
+            # The positions that were left out are within tolerance of these
+            self.box = (min(x for x, _ in points) - self.tolerance, min(y for _, y in points) - self.tolerance,
+                        max(x for x, _ in points) + self.tolerance, max(y for _, y in points) + self.tolerance)
+        min_x, min_y, max_x, max_y = self.box
+        return (min(min_x, current[0]), min(min_y, current[1]),
+                max(max_x, current[0]), max(max_y, current[1]))
+
+    def polyline(self, first: tuple[float, float], current: tuple[float, float]) -> list[tuple[float, float]]:
+        """Returns the points to draw, from the first position of the trail to the current one"""
+        held_back = [self.pending[-1][1]] if self.pending else []
+        return [first, *self.points, *held_back, current]
+
+class TrailCache:
+    """Simplified trails for draw_trail(), kept from frame to frame
+
+    A trail that is drawn zoomed out has most of its points in the same
+    few pixels, or on what looks like a straight line. The simplified
+    trail of a body only keeps the points needed to draw it within
+    TRAIL_LOD_PIXELS at the zoom it was built for, so far fewer points
+    are converted and sent to Tk.
+
+    The simplified trails are in meters, so moving the view doesn't
+    change them. New saved positions are taken in as the trail grows,
+    and the ones the trail has dropped are dropped here too. Only a
+    change of zoom by more than TRAIL_LOD_ZOOM_FACTOR builds one again.
+
+    It is kept on the canvas (see trail_cache_of() in draw.py).
+    """
+    __slots__ = ("trails", "used")
+
+    def __init__(self) -> None:
+        self.trails = {}   # Body key -> SimplifiedTrail
+        self.used = set()  # Body keys drawn since the last forget_unused()
+
+    def simplified(self, key, trail, zoom: float) -> tuple[list[tuple[float, float]],
+                                                         tuple[float, float, float, float]]:
+        """Returns (points, bounds) for trail (like Body.trail_positions) at zoom
+
+        points is the trail with only the points needed at zoom. The first
+        and the last point (the current position) are always kept. bounds
+        is (min_x, min_y, max_x, max_y) around the whole trail, so a trail
+        that is out of frame can be skipped without converting any point.
+
+        key is anything that stays the same for a body from frame to
+        frame (see trail_key() in draw.py).
+        """
+        self.used.add(key)
+        saved = len(trail) - 1  # The last point is the current position
+
+        simple = self.trails.get(key)
+        if simple is None or not 1/TRAIL_LOD_ZOOM_FACTOR < zoom/simple.zoom < TRAIL_LOD_ZOOM_FACTOR:
+            simple = self.trails[key] = SimplifiedTrail(zoom)
+
+        # Count the positions saved since the last frame, from the end
+        new = saved
+        if simple.last is not None:
+            new = 0
+            while new < saved and trail[saved - 1 - new] != simple.last:
+                new += 1
+            if new == saved:
+                # The last one is gone, like after loading a checkpoint
+                simple = self.trails[key] = SimplifiedTrail(zoom)
+
+        simple.take_in(islice(trail, saved - new, saved))
+        simple.drop_before(simple.seen - saved)
+        return simple.polyline(trail[0], trail[-1]), simple.bounds(trail[0], trail[-1])
+
+    def forget_unused(self) -> None:
+        """Forgets the trails of bodies that were not drawn since the last call, like eaten ones"""
+        for key in self.trails.keys() - self.used:
+            del self.trails[key]
+        self.used.clear()
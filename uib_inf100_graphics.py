@@ -228,6 +228,13 @@ class WrappedCanvas(Canvas):
     def create_text(self, *args, **kwargs): self.log('create_text', args, kwargs); return super().create_text(*args, **kwargs)
     def create_window(self, *args, **kwargs): self.log('create_window', args, kwargs); return super().create_window(*args, **kwargs)
 
+    # Moving, changing and deleting items (for retained_drawing)
+    def coords(self, *args, **kwargs): self.log('coords', args, kwargs); return super().coords(*args, **kwargs)
+    def itemconfigure(self, *args, **kwargs): self.log('itemconfigure', args, kwargs); return super().itemconfigure(*args, **kwargs)
+    itemconfig = itemconfigure
+    def tag_raise(self, *args, **kwargs): self.log('tag_raise', args, kwargs); return super().tag_raise(*args, **kwargs)
+    def delete(self, *args, **kwargs): self.log('delete', args, kwargs); return super().delete(*args, **kwargs)
+
     def create_image(self, *args, **kwargs):
         self.log('create_image', args, kwargs);
         uses_image = 'image' in kwargs
@@ -277,13 +284,15 @@ class App(object):
     # Implementation:
     ####################################
 
-    def __init__(app, width=300, height=300, x=0, y=0, title=None, autorun=True, mvc_check=True, log_drawing_calls=True):
+    def __init__(app, width=300, height=300, x=0, y=0, title=None, autorun=True, mvc_check=True, log_drawing_calls=True, retained_drawing=False):
         app.winx, app.winy, app.width, app.height = x, y, width, height
         app.timer_delay = 100     # milliseconds
         app.mouse_movedDelay = 50 # ditto
         app._title = title
         app._mvc_check = mvc_check
         app._log_drawing_calls = log_drawing_calls
+        app.retained_drawing = retained_drawing # if true, the canvas is not cleared before redraw_all
+        app._paused_outline = None # the red outline item when retained_drawing
         app._running = app._paused = False
         app._mouse_pressed_outside_window = False
         if autorun: app.run()
@@ -407,22 +416,38 @@ class App(object):
         app._running = False
         raise Exception('MVC Violation: ' + errMsg)
 
+    def _model_state(app):
+        # What the MVC check compares before and after redraw_all.
+        # mvc_check=True hashes the whole app, which gets slow with a big model.
+        # mvc_check='version' only reads app.model_version, which the model
+        # code must increase every time it changes the model.
+        if (app._mvc_check == 'version'): return app.model_version
+        return get_hash(app) if app._mvc_check else None
+
     @_safe_method
     def _redraw_all_wrapper(app):
         if (not app._running): return
         if ('deferred_redraw_all' in app._afterIdMap): return # wait for pending call
         app._canvas.in_redraw_all = True
-        app._canvas.delete(ALL)
-        width,outline = (10,'red') if app._paused else (0,'white')
-        app._canvas.create_rectangle(0, 0, app.width, app.height, fill='white', width=width, outline=outline)
+        if (not app.retained_drawing):
+            app._canvas.delete(ALL)
+            width,outline = (10,'red') if app._paused else (0,'white')
+            app._canvas.create_rectangle(0, 0, app.width, app.height, fill='white', width=width, outline=outline)
+        elif (app._paused_outline is None):
+            app._paused_outline = app._canvas.create_rectangle(0, 0, app.width, app.height, width=10, outline='red')
         app._canvas.logged_drawing_calls = [ ]
         app._canvas.log_drawing_calls = app._log_drawing_calls
-        hash1 = get_hash(app) if app._mvc_check else None
+        hash1 = app._model_state()
         try:
             app.redraw_all(app._canvas)
-            hash2 = get_hash(app) if app._mvc_check else None
+            hash2 = app._model_state()
             if (hash1 != hash2):
                 app._mvc_violation('you may not change the app state (the model) in redraw_all (the view)')
+            if (app.retained_drawing):
+                # kept on top of what redraw_all drew, and only shown when paused
+                app._canvas.coords(app._paused_outline, 0, 0, app.width, app.height)
+                app._canvas.itemconfigure(app._paused_outline, state='normal' if app._paused else 'hidden')
+                app._canvas.tag_raise(app._paused_outline)
         finally:
             app._canvas.in_redraw_all = False
         app._canvas.update()